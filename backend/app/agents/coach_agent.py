@@ -1,10 +1,19 @@
 # backend/app/agents/coach_agent.py
 
 import logging
-import json
-from typing import Dict, Any
 
-from ..gemini_client import generate_json_from_image
+import orjson
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple
+
+from ..gemini_client import (
+    GEMINI_MODEL,
+    extract_json,
+    generate_batch_json_from_images,
+    read_batch_cache,
+    get_context_cache,
+    generate_json_from_image,
+    generate_json_from_image_stream,
+)
 
 log = logging.getLogger("thumbnail-agent")
 
@@ -62,36 +71,45 @@ Guidelines for text:
 - If the thumbnail is already excellent, keep "improvements" short OR even empty.
 """
 
+# Bump whenever COACH_SYSTEM changes so stale context caches are not reused.
+COACH_PROMPT_VERSION = "1"
 
-async def run_coach_agent(
+COACH_BATCH_NOTE = """
+BATCH MODE
+You will receive several thumbnails in this request, each preceded by a
+"THUMBNAIL <n>" line with its title. Review each one independently and return
+{"results": [...]} with exactly one object per thumbnail, in the order given,
+each object using the OUTPUT FORMAT above.
+"""
+
+# Mirrors the OUTPUT FORMAT above; passed to Gemini as response_schema.
+COACH_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "quality_score": {"type": "NUMBER"},
+        "overall_verdict": {"type": "STRING"},
+        "positives": {"type": "ARRAY", "items": {"type": "STRING"}},
+        "improvements": {"type": "ARRAY", "items": {"type": "STRING"}},
+    },
+    "required": ["quality_score", "overall_verdict", "positives", "improvements"],
+}
+
+
+def build_coach_prompt(
     title: str,
     description: str,
     vision: Dict[str, Any],
     heuristic: Dict[str, Any],
     history_summary: str,
-    image_b64: str,
-) -> Dict[str, Any]:
+) -> str:
     """
-    Coach agent — uses Gemini to produce a structured, modern-meta-aware review.
-
-    Returns a dict with:
-      - agent
-      - summary (string)
-      - quality_score (0–10 float)
-      - positives (list[str])
-      - improvements (list[str])
-      - raw (full parsed Gemini JSON)
+    Assemble the per-request part of the coach prompt. COACH_SYSTEM is sent
+    separately as the system instruction (or via a context cache).
     """
-    log.info("🎯 Coach Agent started")
+    vision_json = orjson.dumps(vision, default=str).decode()
+    heuristic_json = orjson.dumps(heuristic, default=str).decode()
 
-    try:
-        # Build a compact context block for Gemini
-        vision_json = json.dumps(vision, ensure_ascii=False)
-        heuristic_json = json.dumps(heuristic, ensure_ascii=False)
-
-        prompt = f"""{COACH_SYSTEM}
-
-CONTEXT
+    return f"""CONTEXT
 -------
 TITLE: {title or "None"}
 DESCRIPTION: {description or "None"}
@@ -106,98 +124,269 @@ SESSION_HISTORY_SUMMARY:
 {history_summary or "None"}
 """
 
-        # Call Gemini via your shared helper (synchronous function)
-        raw_response = generate_json_from_image(prompt, image_b64=image_b64)
-
-        # ---------------------------
-        # 1) Normalize / parse JSON
-        # ---------------------------
-        if isinstance(raw_response, str):
-            try:
-                raw_response = json.loads(raw_response)
-                log.info("📦 Coach Agent: parsed string JSON successfully.")
-            except Exception:
-                log.warning("⚠️ Coach Agent: Gemini returned plain text, not JSON.")
-                return {
-                    "agent": "coach",
-                    "summary": raw_response[:250],
-                    "quality_score": 0.0,
-                    "positives": [],
-                    "improvements": [],
-                    "error": "Invalid Gemini JSON response",
-                }
-
-        if not isinstance(raw_response, dict):
-            log.warning(
-                "⚠️ Coach Agent: unexpected response type from Gemini: %s",
-                type(raw_response),
-            )
+
+def normalize_coach_response(raw_response: Any) -> Dict[str, Any]:
+    """
+    Turn whatever Gemini returned into the coach result dict
+    (see run_coach_agent for the shape).
+    """
+    # ---------------------------
+    # 1) Normalize / parse JSON
+    # ---------------------------
+    if isinstance(raw_response, str):
+        try:
+            raw_response = orjson.loads(raw_response)
+            log.info("Coach agent: parsed string JSON successfully")
+        except Exception:
+            log.warning("Coach agent: Gemini returned plain text, not JSON")
             return {
                 "agent": "coach",
-                "summary": str(raw_response)[:250],
+                "summary": raw_response[:250],
                 "quality_score": 0.0,
                 "positives": [],
                 "improvements": [],
-                "error": f"Unexpected Gemini return type: {type(raw_response)}",
+                "error": "Invalid Gemini JSON response",
             }
 
-        # ---------------------------
-        # 2) Extract and clean fields
-        # ---------------------------
-        quality_score = raw_response.get("quality_score", 0)
-
-        # Handle score as string or other type
-        if isinstance(quality_score, str):
-            try:
-                quality_score = float(quality_score)
-            except ValueError:
-                quality_score = 0.0
-        elif not isinstance(quality_score, (int, float)):
+    if not isinstance(raw_response, dict):
+        log.warning(
+            "Coach agent: unexpected response type from Gemini: %s",
+            type(raw_response),
+        )
+        return {
+            "agent": "coach",
+            "summary": str(raw_response)[:250],
+            "quality_score": 0.0,
+            "positives": [],
+            "improvements": [],
+            "error": f"Unexpected Gemini return type: {type(raw_response)}",
+        }
+
+    # Gemini call failed (see generate_json_from_image): surface it instead
+    # of dressing it up as a 0-score review.
+    if raw_response.get("error"):
+        log.warning("Coach agent: Gemini error: %s", raw_response["error"])
+        return {
+            "agent": "coach",
+            "summary": "Coach analysis failed.",
+            "quality_score": 0.0,
+            "positives": [],
+            "improvements": [],
+            "error": str(raw_response["error"]),
+        }
+
+    # ---------------------------
+    # 2) Extract and clean fields
+    # ---------------------------
+    quality_score = raw_response.get("quality_score", 0)
+
+    # Handle score as string or other type
+    if isinstance(quality_score, str):
+        try:
+            quality_score = float(quality_score)
+        except ValueError:
             quality_score = 0.0
+    elif not isinstance(quality_score, (int, float)):
+        quality_score = 0.0
+
+    # Clamp to 0–10 and round to one decimal
+    quality_score = round(max(0.0, min(float(quality_score), 10.0)), 1)
+
+    summary = (
+        raw_response.get("overall_verdict")
+        or raw_response.get("summary")
+        or "No summary provided."
+    )
+    if isinstance(summary, dict):
+        summary = orjson.dumps(summary, default=str).decode()
+    summary = str(summary).strip()
+
+    positives = raw_response.get("positives") or []
+    improvements = raw_response.get("improvements") or []
+
+    # Normalize lists to lists of strings, limit length so UI doesn't explode
+    def normalize_list(value):
+        if not isinstance(value, list):
+            return []
+        return [str(x).strip() for x in value if str(x).strip()][:6]
+
+    positives = normalize_list(positives)
+    improvements = normalize_list(improvements)
+
+    return {
+        "agent": "coach",
+        "summary": summary,
+        "quality_score": quality_score,
+        "positives": positives,
+        "improvements": improvements,
+        "raw": raw_response,
+    }
+
+
+async def get_coach_context_cache() -> Optional[str]:
+    """
+    Context cache holding COACH_SYSTEM, keyed by model and prompt version,
+    so every coach call can reference it instead of resending the prompt.
+    None if caching is unavailable; callers then send COACH_SYSTEM inline.
+    """
+    key = f"coach:{GEMINI_MODEL}:{COACH_PROMPT_VERSION}"
+    return await get_context_cache(key, COACH_SYSTEM)
 
-        # Clamp to 0–10 and round to one decimal
-        quality_score = round(max(0.0, min(float(quality_score), 10.0)), 1)
 
-        summary = (
-            raw_response.get("overall_verdict")
-            or raw_response.get("summary")
-            or "No summary provided."
+async def run_coach_agent(
+    title: str,
+    description: str,
+    vision: Dict[str, Any],
+    heuristic: Dict[str, Any],
+    history_summary: str,
+    image_bytes: bytes,
+    mime_type: str = "image/jpeg",
+    image_id: Optional[str] = None,
+    cached_content_name: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Coach agent — uses Gemini to produce a structured, modern-meta-aware review.
+
+    Returns a dict with:
+      - agent
+      - summary (string)
+      - quality_score (0–10 float)
+      - positives (list[str])
+      - improvements (list[str])
+      - raw (full parsed Gemini JSON)
+
+    `image_bytes` should already be shrunk by prepare_image_for_gemini;
+    `image_id` is the original upload's sha256 (response-cache key).
+    `cached_content_name` comes from get_coach_context_cache.
+    """
+    log.info("Coach agent started")
+
+    try:
+        prompt = build_coach_prompt(
+            title, description, vision, heuristic, history_summary
         )
-        if isinstance(summary, dict):
-            summary = json.dumps(summary, ensure_ascii=False)
-        summary = str(summary).strip()
 
-        positives = raw_response.get("positives") or []
-        improvements = raw_response.get("improvements") or []
+        raw_response = await generate_json_from_image(
+            prompt,
+            image_bytes,
+            mime_type,
+            schema=COACH_SCHEMA,
+            image_id=image_id,
+            system_instruction=COACH_SYSTEM,
+            cached_content=cached_content_name,
+        )
+
+        result = normalize_coach_response(raw_response)
+        log.info("Coach agent complete quality_score=%s", result["quality_score"])
+        return result
+
+    except Exception as e:
+        log.error("Coach agent failed: %s", e)
+        return {
+            "agent": "coach",
+            "error": str(e),
+            "summary": "Coach analysis failed.",
+            "quality_score": 0.0,
+            "positives": [],
+            "improvements": [],
+        }
+
+
+async def stream_coach_agent(
+    title: str,
+    description: str,
+    vision: Dict[str, Any],
+    heuristic: Dict[str, Any],
+    history_summary: str,
+    image_bytes: bytes,
+    mime_type: str = "image/jpeg",
+    image_id: Optional[str] = None,
+    cached_content_name: Optional[str] = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Streaming variant of run_coach_agent.
 
-        # Normalize lists to lists of strings, limit length so UI doesn't explode
-        def normalize_list(value):
-            if not isinstance(value, list):
-                return []
-            return [str(x).strip() for x in value if str(x).strip()][:6]
+    Yields {"token": str} events as Gemini produces text, then one final
+    {"coach": dict} event with the same shape run_coach_agent returns.
+    """
+    log.info("Coach agent (stream) started")
 
-        positives = normalize_list(positives)
-        improvements = normalize_list(improvements)
+    chunks: List[str] = []
+    try:
+        prompt = build_coach_prompt(
+            title, description, vision, heuristic, history_summary
+        )
+        async for text in generate_json_from_image_stream(
+            prompt,
+            image_bytes,
+            mime_type,
+            schema=COACH_SCHEMA,
+            image_id=image_id,
+            system_instruction=COACH_SYSTEM,
+            cached_content=cached_content_name,
+        ):
+            chunks.append(text)
+            yield {"token": text}
+
+        # Parse once at EOF — partial JSON is never valid anyway.
+        raw_text = "".join(chunks)
+        parsed = extract_json(raw_text)
+        result = normalize_coach_response(parsed or raw_text)
 
+    except Exception as e:
+        log.error("Coach agent (stream) failed: %s", e)
         result = {
             "agent": "coach",
-            "summary": summary,
-            "quality_score": quality_score,
-            "positives": positives,
-            "improvements": improvements,
-            "raw": raw_response,
+            "error": str(e),
+            "summary": "Coach analysis failed.",
+            "quality_score": 0.0,
+            "positives": [],
+            "improvements": [],
         }
 
-        log.info("✅ Coach Agent complete (quality_score=%s)", quality_score)
-        return result
+    yield {"coach": result}
 
-    except Exception as e:
-        log.error("❌ Coach Agent failed: %s", e)
+
+def _coach_batch_result(raw: Dict[str, Any]) -> Dict[str, Any]:
+    if "error" in raw:
         return {
             "agent": "coach",
-            "error": str(e),
+            "error": raw["error"],
             "summary": "Coach analysis failed.",
             "quality_score": 0.0,
             "positives": [],
             "improvements": [],
         }
+    return normalize_coach_response(raw)
+
+
+async def cached_coach_batch_review(
+    image_bytes: bytes, title: str
+) -> Optional[Dict[str, Any]]:
+    """
+    run_coach_batch's result for one thumbnail if it is already cached, so
+    the caller can answer without waiting for a batch. None on miss.
+    """
+    raw = await read_batch_cache(COACH_SYSTEM + COACH_BATCH_NOTE, image_bytes, title)
+    return None if raw is None else _coach_batch_result(raw)
+
+
+async def run_coach_batch(items: List[Tuple[bytes, str, str]]) -> List[Dict[str, Any]]:
+    """
+    Review several (image_bytes, mime_type, title) thumbnails with a single
+    Gemini request. Returns one coach result dict per item, in order.
+    """
+    log.info("Coach agent batch started (%d thumbnails)", len(items))
+
+    labels = [
+        f"THUMBNAIL {i}: TITLE: {title or 'None'}"
+        for i, (_, _, title) in enumerate(items, start=1)
+    ]
+    raws = await generate_batch_json_from_images(
+        COACH_SYSTEM + COACH_BATCH_NOTE,
+        [(image_bytes, mime_type) for image_bytes, mime_type, _ in items],
+        labels,
+        schema=COACH_SCHEMA,
+        cache_tags=[title for _, _, title in items],
+    )
+    return [_coach_batch_result(raw) for raw in raws]
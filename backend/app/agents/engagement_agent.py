@@ -40,7 +40,7 @@ async def run_engagement_agent(
         }
 
     except Exception as e:
-        log.error(f"❌ Engagement Agent failed: {e}")
+        log.error("Engagement agent failed: %s", e)
         return {
             "agent": "engagement",
             "error": str(e),
@@ -1,37 +1,47 @@
 # backend/app/agents/heuristic_agent.py
 
-import io
+import asyncio
+import functools
 import logging
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
-from PIL import Image, ImageStat
+from PIL import Image
+
+from ..imaging import channel_stats, decode_image
+from ..workers import get_cpu_pool
 
 log = logging.getLogger("thumbnail-agent")
 
 
+@functools.lru_cache(maxsize=1024)
+def _aspect_score(w: int, h: int) -> float:
+    # Thumbnails cluster on a handful of resolutions, so this nearly always hits.
+    aspect = w / max(h, 1)
+    ideal = 16.0 / 9.0
+    diff = abs(aspect - ideal)
+    if diff < 0.1:
+        return 9.5
+    elif diff < 0.3:
+        return 8.0
+    elif diff < 0.6:
+        return 6.0
+    return max(0.0, 6.0 - (diff - 0.6) * 8.0)
+
+
 def _compute_basic_metrics(img: Image.Image) -> Dict[str, float]:
     w, h = img.size
-    stat = ImageStat.Stat(img)
 
-    r_mean, g_mean, b_mean = stat.mean
+    means, stds = channel_stats(img)
+
+    r_mean, g_mean, b_mean = means
     brightness = (r_mean + g_mean + b_mean) / 3.0
     brightness_score = max(0.0, min(10.0, (brightness / 255.0) * 10.0))
 
-    r_std, g_std, b_std = stat.stddev
+    r_std, g_std, b_std = stds
     contrast_raw = (r_std + g_std + b_std) / 3.0
     contrast_score = max(0.0, min(10.0, (contrast_raw / 80.0) * 10.0))
 
-    aspect = w / max(h, 1)
-    ideal = 16.0 / 9.0
-    diff = abs(aspect - ideal)
-    if diff < 0.1:
-        aspect_score = 9.5
-    elif diff < 0.3:
-        aspect_score = 8.0
-    elif diff < 0.6:
-        aspect_score = 6.0
-    else:
-        aspect_score = max(0.0, 6.0 - (diff - 0.6) * 8.0)
+    aspect_score = _aspect_score(w, h)
 
     return {
         "brightness": round(brightness_score, 1),
@@ -42,21 +52,40 @@ def _compute_basic_metrics(img: Image.Image) -> Dict[str, float]:
     }
 
 
+def _heuristic_worker(image_bytes: bytes) -> Dict[str, float]:
+    """Decode + metrics; module-level so the process pool can pickle it."""
+    return _compute_basic_metrics(decode_image(image_bytes))
+
+
 async def run_heuristic_agent(
     image_bytes: bytes,
     title: str = "",
     description: str = "",
+    pil_img: Optional[Image.Image] = None,
 ) -> Dict[str, Any]:
     """
     Lightweight, non-Gemini analysis:
     - Brightness, contrast, aspect ratio fit.
     - One heuristic score from these metrics.
     Used for quick metrics and as a sanity check for the coach.
+
+    Decoding `image_bytes` runs in the shared process pool so concurrent
+    uploads use every core and never stall the event loop; only the
+    compressed bytes cross to the worker. When `pil_img` (the RGB image
+    decoded at ingress) is given there is nothing left to decode, so the
+    one histogram pass runs in a thread instead of pickling megabytes of
+    raw pixels to another process.
     """
     try:
-        img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+        if pil_img is not None:
+            metrics = await asyncio.to_thread(_compute_basic_metrics, pil_img)
+        else:
+            loop = asyncio.get_running_loop()
+            metrics = await loop.run_in_executor(
+                get_cpu_pool(), _heuristic_worker, image_bytes
+            )
     except Exception as e:
-        log.error(f"HeuristicAgent: failed to open image: {e}")
+        log.error("HeuristicAgent: failed to analyze image: %s", e)
         return {
             "agent": "heuristic",
             "error": str(e),
@@ -66,7 +95,6 @@ async def run_heuristic_agent(
             "metrics": {},
         }
 
-    metrics = _compute_basic_metrics(img)
     b = metrics["brightness"]
     c = metrics["contrast"]
     a = metrics["aspect_ratio_fit"]
@@ -1,14 +1,14 @@
 # backend/app/agents/vision_agent.py
 
 import logging
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from PIL import Image
 import io
-import base64
 import asyncio
-import json
+import orjson
 
 from ..gemini_client import generate_json_from_image
+from ..imaging import prepare_image_for_gemini
 
 log = logging.getLogger("thumbnail-agent")
 
@@ -34,14 +34,36 @@ Return ONLY valid JSON in this shape:
 Focus on what is visually there, not advice or critique.
 """
 
-async def run_vision_agent(image_bytes: bytes) -> Dict[str, Any]:
+# Mirrors the JSON shape above; passed to Gemini as response_schema.
+VISION_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "summary": {"type": "STRING"},
+        "details": {"type": "ARRAY", "items": {"type": "STRING"}},
+        "tags": {"type": "ARRAY", "items": {"type": "STRING"}},
+    },
+    "required": ["summary", "details", "tags"],
+}
+
+async def run_vision_agent(
+    image_bytes: bytes,
+    gemini_bytes: Optional[bytes] = None,
+    mime_type: str = "image/jpeg",
+    image_id: Optional[str] = None,
+    pil_img: Optional[Image.Image] = None,
+) -> Dict[str, Any]:
     """
     Vision agent:
     - Uses PIL to get resolution & aspect ratio.
     - Uses Gemini to describe the visual content.
+
+    `gemini_bytes` is the upload already shrunk by prepare_image_for_gemini;
+    when omitted, the agent prepares it itself. `image_id` is the upload's
+    sha256, used as the response-cache key. `pil_img` is the image decoded
+    at ingress; when given, the bytes are not re-opened for the size.
     """
     try:
-        img = Image.open(io.BytesIO(image_bytes))
+        img = pil_img if pil_img is not None else Image.open(io.BytesIO(image_bytes))
         w, h = img.size
         aspect_ratio = round(w / max(h, 1), 2)
 
@@ -50,8 +72,6 @@ async def run_vision_agent(image_bytes: bytes) -> Dict[str, Any]:
         diff = abs(aspect_ratio - target)
         aspect_fit = max(0.0, 10.0 - diff * 10.0)  # simple 0–10 score
 
-        image_b64 = base64.b64encode(image_bytes).decode("utf-8")
-
         prompt = f"""{VISION_SYSTEM}
 
 IMAGE_METADATA:
@@ -60,18 +80,24 @@ IMAGE_METADATA:
 - aspect_ratio: {aspect_ratio} (16:9 ≈ 1.78)
 """
 
-        # Run Gemini in worker thread so main loop can time out
-        raw = await asyncio.to_thread(
-            generate_json_from_image,
+        if gemini_bytes is None:
+            gemini_bytes, mime_type = await asyncio.to_thread(
+                prepare_image_for_gemini, image_bytes, pil_img
+            )
+
+        raw = await generate_json_from_image(
             prompt,
-            image_b64,
+            gemini_bytes,
+            mime_type,
+            schema=VISION_SCHEMA,
+            image_id=image_id,
         )
 
         if isinstance(raw, str):
             try:
-                raw = json.loads(raw)
+                raw = orjson.loads(raw)
             except Exception:
-                log.warning("Vision Agent got string response that was not valid JSON.")
+                log.warning("Vision agent got string response that was not valid JSON")
                 raw = {}
 
         if not isinstance(raw, dict):
@@ -86,7 +112,7 @@ IMAGE_METADATA:
             details = [str(details)]
         details = [str(d) for d in details]
 
-        return {
+        result = {
             "agent": "vision",
             "width": w,
             "height": h,
@@ -96,9 +122,13 @@ IMAGE_METADATA:
             "details": details,
             "tags": tags,
         }
+        # Keep Gemini failures visible so callers don't cache a degraded result.
+        if raw.get("error"):
+            result["error"] = str(raw["error"])
+        return result
 
     except Exception as e:
-        log.error(f"Vision agent failed: {e}")
+        log.error("Vision agent failed: %s", e)
         return {
             "agent": "vision",
             "error": str(e),
@@ -1,6 +1,8 @@
 # backend/app/ai_gemini.py
 
 import os
+import re
+import orjson
 import google.generativeai as genai
 from typing import Optional
 import asyncio
@@ -14,15 +16,35 @@ if not api_key:
 genai.configure(api_key=api_key)
 print("[Gemini] Initialized successfully.")
 
+_JSON_BLOCK_RE = re.compile(r"\{.*\}", re.S)
+
+# One GenerativeModel per model name, reused so calls share the SDK's
+# HTTP connection pool instead of rebuilding the client every time.
+_MODELS: dict[str, genai.GenerativeModel] = {}
+
+
+def _get_model(model_name: str) -> genai.GenerativeModel:
+    model = _MODELS.get(model_name)
+    if model is None:
+        model = _MODELS[model_name] = genai.GenerativeModel(model_name)
+    return model
+
 
 # --- Async text generation helper ---
-async def generate_text(prompt: str, model_name: str = "gemini-2.0-flash", timeout: int = 20) -> str:
+async def generate_text(
+    prompt: str,
+    model_name: str = "gemini-2.0-flash",
+    timeout: int = 20,
+    generation_config: Optional[dict] = None,
+) -> str:
     """
     Generate a text response from Gemini asynchronously with timeout safety.
     """
     async def _inner():
-        model = genai.GenerativeModel(model_name)
-        response = await asyncio.to_thread(model.generate_content, prompt)
+        model = _get_model(model_name)
+        response = await asyncio.to_thread(
+            model.generate_content, prompt, generation_config=generation_config
+        )
         return getattr(response, "text", "").strip() if response else ""
 
     try:
@@ -38,18 +60,20 @@ async def generate_json_from_text(prompt: str, model_name: str = "gemini-2.0-fla
     """
     Attempts to generate a structured JSON-like response from Gemini.
     """
-    text = await generate_text(prompt, model_name=model_name, timeout=timeout)
-    import json
-
+    text = await generate_text(
+        prompt,
+        model_name=model_name,
+        timeout=timeout,
+        generation_config={"response_mime_type": "application/json"},
+    )
     try:
         # Try parsing as JSON directly
         if text.strip().startswith("{"):
-            return json.loads(text)
+            return orjson.loads(text)
         # Try extracting a JSON block if extra text
-        import re
-        match = re.search(r"\{.*\}", text, re.S)
+        match = _JSON_BLOCK_RE.search(text)
         if match:
-            return json.loads(match.group(0))
+            return orjson.loads(match.group(0))
     except Exception:
         pass
 
@@ -0,0 +1,175 @@
+# backend/app/cache.py
+
+import asyncio
+import copy
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+CACHE_DIR = os.getenv("GEMINI_CACHE_DIR") or os.path.join(
+    os.path.dirname(__file__), ".gemini_cache"
+)
+MEMORY_CACHE_SIZE = 256
+# Disk entries unused for this long are dropped; past the entry cap the
+# least recently used go first. Pruning runs every DISK_CACHE_PRUNE_EVERY writes.
+DISK_CACHE_TTL_SEC = float(os.getenv("GEMINI_CACHE_TTL_SEC", str(7 * 24 * 3600)))
+DISK_CACHE_MAX_ENTRIES = int(os.getenv("GEMINI_CACHE_MAX_ENTRIES", "5000"))
+DISK_CACHE_PRUNE_EVERY = 100
+
+
+class LRUCache:
+    """
+    Small thread-safe LRU for dict payloads.
+    (functools.lru_cache can't be used here: keys are computed, values are dicts.)
+    """
+
+    def __init__(self, maxsize: int = MEMORY_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Any, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Any) -> Optional[Any]:
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key: Any, value: Any) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+class TTLCache(LRUCache):
+    """LRUCache whose entries also expire `ttl_sec` after being set."""
+
+    def __init__(self, maxsize: int = MEMORY_CACHE_SIZE, ttl_sec: float = 3600.0):
+        super().__init__(maxsize)
+        self.ttl_sec = ttl_sec
+
+    def get(self, key: Any) -> Optional[Any]:
+        entry = super().get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        return value if expires_at > time.monotonic() else None
+
+    def set(self, key: Any, value: Any) -> None:
+        super().set(key, (time.monotonic() + self.ttl_sec, value))
+
+
+_memory = LRUCache()
+_writes_since_prune = 0
+_prune_lock = threading.Lock()
+
+
+def _cache_path(key: str) -> str:
+    return os.path.join(CACHE_DIR, f"{key}.json")
+
+
+def _read_disk(key: str) -> Optional[Dict[str, Any]]:
+    path = _cache_path(key)
+    try:
+        if time.time() - os.path.getmtime(path) > DISK_CACHE_TTL_SEC:
+            os.remove(path)
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        os.utime(path)  # mtime doubles as last-use time for pruning
+        return data if isinstance(data, dict) else None
+    except Exception:
+        return None
+
+
+def _prune_disk() -> None:
+    """Drop expired entries, then the least recently used past the cap."""
+    now = time.time()
+    entries = []
+    try:
+        with os.scandir(CACHE_DIR) as it:
+            for entry in it:
+                if not entry.name.endswith(".json"):
+                    continue
+                try:
+                    mtime = entry.stat().st_mtime
+                except OSError:
+                    continue
+                if now - mtime > DISK_CACHE_TTL_SEC:
+                    _remove_quietly(entry.path)
+                else:
+                    entries.append((mtime, entry.path))
+    except OSError:
+        return
+    if len(entries) > DISK_CACHE_MAX_ENTRIES:
+        entries.sort()
+        for _, path in entries[: len(entries) - DISK_CACHE_MAX_ENTRIES]:
+            _remove_quietly(path)
+
+
+def _remove_quietly(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _write_disk(key: str, value: Dict[str, Any]) -> None:
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp = _cache_path(key) + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(value, f, ensure_ascii=False)
+        os.replace(tmp, _cache_path(key))
+    except Exception:
+        return
+
+    global _writes_since_prune
+    with _prune_lock:
+        _writes_since_prune += 1
+        if _writes_since_prune < DISK_CACHE_PRUNE_EVERY:
+            return
+        _writes_since_prune = 0
+        _prune_disk()
+
+
+def read_cache(key: str) -> Optional[Dict[str, Any]]:
+    """
+    Look up a cached Gemini response: in-process LRU first, then disk.
+    Returns a copy so callers can mutate it freely, or None on miss.
+    """
+    value = _memory.get(key)
+    if value is None:
+        value = _read_disk(key)
+        if value is None:
+            return None
+        _memory.set(key, value)
+    return copy.deepcopy(value)
+
+
+def write_cache(key: str, value: Dict[str, Any]) -> None:
+    """Store a Gemini response in both the LRU and the disk cache."""
+    _memory.set(key, copy.deepcopy(value))
+    _write_disk(key, value)
+
+
+async def aread_cache(key: str) -> Optional[Dict[str, Any]]:
+    """read_cache for async callers: only a disk lookup leaves the event loop."""
+    value = _memory.get(key)
+    if value is None:
+        value = await asyncio.to_thread(_read_disk, key)
+        if value is None:
+            return None
+        _memory.set(key, value)
+    return copy.deepcopy(value)
+
+
+async def awrite_cache(key: str, value: Dict[str, Any]) -> None:
+    """write_cache for async callers; the disk write runs in a worker thread."""
+    _memory.set(key, copy.deepcopy(value))
+    await asyncio.to_thread(_write_disk, key, value)
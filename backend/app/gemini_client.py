@@ -1,69 +1,366 @@
 import os
-import re
 import json
-from typing import Dict, Any
+import asyncio
+import random
+import time
+import hashlib
+import logging
+import httpx
+import orjson
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple
 from google import genai
+from google.genai import types
+
+from .cache import aread_cache, awrite_cache
 
 # --- Setup ---
 API_KEY = os.getenv("GOOGLE_API_KEY") or os.getenv("GEMINI_API_KEY")
 if not API_KEY:
     raise RuntimeError("Missing GOOGLE_API_KEY or GEMINI_API_KEY environment variable.")
 
-client = genai.Client(api_key=API_KEY)
+GEMINI_MAX_CONNECTIONS = int(os.getenv("GEMINI_MAX_CONNECTIONS", "100"))
+
+# One process-wide client, so every agent shares its connection pool and
+# TLS sessions. Calls go through client.aio: each Gemini request is a plain
+# await on the SDK's async httpx client (HTTP/2, so concurrent agent calls
+# multiplex over few sockets) and no executor thread is parked per request.
+client = genai.Client(
+    api_key=API_KEY,
+    http_options=types.HttpOptions(
+        async_client_args={
+            "http2": True,
+            "limits": httpx.Limits(
+                max_connections=GEMINI_MAX_CONNECTIONS,
+                max_keepalive_connections=GEMINI_MAX_CONNECTIONS // 2,
+            ),
+        }
+    ),
+)
+
+GEMINI_MODEL = "gemini-2.0-flash"
+
+_JSON_DECODER = json.JSONDecoder()
+
+log = logging.getLogger("thumbnail-agent")
+
+# Ceiling on in-flight Gemini requests per process, so bursts queue here
+# instead of tripping the API quota and cascading into 429 retries.
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+_GEMINI_SEM = asyncio.Semaphore(GEMINI_MAX_CONCURRENCY)
+
+MAX_RETRIES = 4
+_RETRYABLE_CODES = {429, 500, 502, 503, 504}
+_RETRYABLE_MARKERS = ("RESOURCE_EXHAUSTED", "UNAVAILABLE", "DEADLINE_EXCEEDED")
+
+# Gemini context caches for shared system prompts. Off by default: the API
+# rejects caches under the model's minimum size, which today's prompts are.
+CONTEXT_CACHE_ENABLED = os.getenv("GEMINI_CONTEXT_CACHE", "0") == "1"
+# Lifetime of a created context cache; 0 also disables them.
+CONTEXT_CACHE_TTL_SEC = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL_SEC", "600"))
+# Smallest prompt (in tokens) the model accepts into a context cache.
+CONTEXT_CACHE_MIN_TOKENS = int(os.getenv("GEMINI_CONTEXT_CACHE_MIN_TOKENS", "4096"))
+# Cap on a caches.create round trip; past it, requests send the prompt inline.
+CONTEXT_CACHE_CREATE_TIMEOUT_SEC = float(
+    os.getenv("GEMINI_CONTEXT_CACHE_CREATE_TIMEOUT_SEC", "3")
+)
+# How long a failed or timed-out creation is remembered before retrying.
+CONTEXT_CACHE_RETRY_SEC = 60.0
+# key -> (cached content name or None if creation failed, local expiry)
+_context_caches: Dict[str, Tuple[Optional[str], float]] = {}
+# key -> creation in flight, shared by every request that arrives meanwhile
+_context_cache_pending: Dict[str, "asyncio.Task[Optional[str]]"] = {}
+
+
+async def aclose() -> None:
+    """Close the shared client's async connection pool (app shutdown)."""
+    await client.aio.aclose()
+
+
+async def warm_up() -> None:
+    """
+    Open the shared client's connection at startup (DNS, TLS, HTTP/2
+    handshake) with a free model-metadata call, so the first real request
+    doesn't pay for it. Failures are only logged; the app still starts.
+    """
+    try:
+        await client.aio.models.get(model=GEMINI_MODEL)
+    except Exception as e:
+        log.warning("Gemini warm-up failed: %s", e)
 
 
 # --- Helpers ---
 
-def _extract_json(text: str) -> Dict[str, Any]:
+def extract_json(text: str) -> Dict[str, Any]:
     """
     Try to find and parse a JSON block from Gemini text output.
     Returns {} if parsing fails.
+
+    Linear in the response size: a direct parse first, then a single
+    raw_decode from the first "{" (no greedy regex, no re-scan on failure),
+    which also tolerates prose or code fences around the object.
     """
     if not text:
         return {}
-    match = re.search(r"(\{[\s\S]*\})", text)
-    if not match:
+    try:
+        parsed = orjson.loads(text)
+        return parsed if isinstance(parsed, dict) else {}
+    except ValueError:
+        pass
+    start = text.find("{")
+    if start == -1:
         return {}
     try:
-        return json.loads(match.group(1))
-    except Exception:
-        # As a last resort, try to sanitize bad JSON
+        parsed, _ = _JSON_DECODER.raw_decode(text, start)
+    except ValueError:
+        return {}
+    return parsed if isinstance(parsed, dict) else {}
+
+
+def _is_retryable(e: Exception) -> bool:
+    """
+    Transient Gemini failures: rate limits, overload, 5xx, deadlines, and
+    network errors. Judged from the structured fields of google-genai's
+    APIError (code / status), never from the message text.
+    """
+    code = getattr(e, "code", None)
+    if not isinstance(code, int):
+        code = getattr(e, "status_code", None)
+    if isinstance(code, int):
+        return code in _RETRYABLE_CODES
+    if getattr(e, "status", None) in _RETRYABLE_MARKERS:
+        return True
+    return isinstance(e, (httpx.TransportError, asyncio.TimeoutError))
+
+
+async def _generate_content(**kwargs: Any) -> Any:
+    """
+    client.aio.models.generate_content with exponential backoff + jitter on
+    transient errors; anything else fails fast. Each attempt holds one
+    concurrency slot, released while backing off.
+    """
+    for attempt in range(MAX_RETRIES):
         try:
-            cleaned = re.sub(r"[^{}:,0-9a-zA-Z\"'\[\]\s]", "", match.group(1))
-            return json.loads(cleaned)
-        except Exception:
-            return {}
+            async with _GEMINI_SEM:
+                return await client.aio.models.generate_content(**kwargs)
+        except Exception as e:
+            if attempt == MAX_RETRIES - 1 or not _is_retryable(e):
+                raise
+            delay = min(2 ** attempt, 30) + random.uniform(0, 0.5)
+            log.warning(
+                "Gemini call failed (%s); retry %d/%d in %.1fs",
+                e, attempt + 1, MAX_RETRIES - 1, delay,
+            )
+            await asyncio.sleep(delay)
+
+
+async def _open_stream(**kwargs: Any) -> AsyncIterator[Any]:
+    """
+    client.aio.models.generate_content_stream with the same retry policy as
+    _generate_content. Only opening the stream holds a concurrency slot:
+    reading it is paced by the client, so the slot is released once Gemini
+    has accepted the request. Errors mid-stream are not retried.
+    """
+    for attempt in range(MAX_RETRIES):
+        try:
+            async with _GEMINI_SEM:
+                return await client.aio.models.generate_content_stream(**kwargs)
+        except Exception as e:
+            if attempt == MAX_RETRIES - 1 or not _is_retryable(e):
+                raise
+            delay = min(2 ** attempt, 30) + random.uniform(0, 0.5)
+            log.warning(
+                "Gemini stream failed to open (%s); retry %d/%d in %.1fs",
+                e, attempt + 1, MAX_RETRIES - 1, delay,
+            )
+            await asyncio.sleep(delay)
+
+
+def _json_config(schema: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Generation config forcing a bare JSON response (optionally schema-bound)."""
+    config: Dict[str, Any] = {"response_mime_type": "application/json"}
+    if schema:
+        config["response_schema"] = schema
+    return config
+
+
+def _image_part(image_bytes: bytes, mime_type: str) -> types.Part:
+    """Raw bytes as an inline part; the SDK base64-encodes once on the wire."""
+    return types.Part.from_bytes(data=image_bytes, mime_type=mime_type)
+
+
+def _image_contents(prompt: str, image_bytes: bytes, mime_type: str) -> list:
+    return [{"text": prompt}, _image_part(image_bytes, mime_type)]
+
+
+def _image_cache_key(
+    prompt: str,
+    image_bytes: bytes,
+    image_id: Optional[str] = None,
+    system_instruction: Optional[str] = None,
+) -> str:
+    """
+    sha256([system |] prompt | image). Pass the upload's precomputed
+    `image_id` to avoid re-hashing the image bytes on every call.
+    """
+    image_part = image_id.encode("ascii") if image_id else image_bytes
+    text = f"{system_instruction}|{prompt}" if system_instruction else prompt
+    return hashlib.sha256(text.encode("utf-8") + b"|" + image_part).hexdigest()
+
+
+def _request(
+    prompt: str,
+    image_bytes: bytes,
+    mime_type: str,
+    schema: Optional[Dict[str, Any]],
+    system_instruction: Optional[str],
+    cached_content: Optional[str],
+) -> Tuple[list, Dict[str, Any]]:
+    """
+    (contents, config) for an image call. With `cached_content`, the system
+    instruction already lives in that handle and is not sent again.
+    """
+    config = _json_config(schema)
+    if cached_content:
+        config["cached_content"] = cached_content
+    elif system_instruction:
+        config["system_instruction"] = system_instruction
+    return _image_contents(prompt, image_bytes, mime_type), config
+
+
+# --- Context caching ---
+
+async def get_context_cache(key: str, system_instruction: str) -> Optional[str]:
+    """
+    Return the name of a Gemini context cache holding `system_instruction`,
+    creating it on first use for `key`.
+
+    Only long-lived, shared prefixes belong here (one cache per prompt
+    version, not per upload): callers then send `cached_content` instead of
+    the system instruction on every request.
+
+    Returns None — callers fall back to `system_instruction` — unless
+    GEMINI_CONTEXT_CACHE=1. Concurrent callers share one creation attempt.
+    """
+    if not CONTEXT_CACHE_ENABLED or CONTEXT_CACHE_TTL_SEC <= 0:
+        return None
+
+    hit = _context_caches.get(key)
+    if hit is not None and hit[1] > time.monotonic():
+        return hit[0]
+
+    task = _context_cache_pending.get(key)
+    if task is None:
+        task = asyncio.create_task(_create_context_cache(key, system_instruction))
+        _context_cache_pending[key] = task
+        task.add_done_callback(lambda _: _context_cache_pending.pop(key, None))
+    # shield: one caller giving up must not cancel the others' creation.
+    return await asyncio.shield(task)
+
+
+async def _create_context_cache(key: str, system_instruction: str) -> Optional[str]:
+    """
+    Create the context cache for `key` and remember the outcome.
+
+    A prompt under CONTEXT_CACHE_MIN_TOKENS is remembered as uncacheable for
+    good, without calling caches.create. Failures, or a round trip longer
+    than CONTEXT_CACHE_CREATE_TIMEOUT_SEC, are remembered for
+    CONTEXT_CACHE_RETRY_SEC so they are not retried on every request.
+    """
+    now = time.monotonic()
+    try:
+        counted = await asyncio.wait_for(
+            client.aio.models.count_tokens(
+                model=GEMINI_MODEL, contents=system_instruction
+            ),
+            CONTEXT_CACHE_CREATE_TIMEOUT_SEC,
+        )
+        tokens = counted.total_tokens or 0
+        if tokens < CONTEXT_CACHE_MIN_TOKENS:
+            log.info(
+                "Context cache %s skipped: %d tokens < %d minimum; sending full prompts",
+                key, tokens, CONTEXT_CACHE_MIN_TOKENS,
+            )
+            _context_caches[key] = (None, float("inf"))
+            return None
+
+        cached = await asyncio.wait_for(
+            client.aio.caches.create(
+                model=GEMINI_MODEL,
+                config={
+                    "system_instruction": system_instruction,
+                    "ttl": f"{CONTEXT_CACHE_TTL_SEC}s",
+                },
+            ),
+            CONTEXT_CACHE_CREATE_TIMEOUT_SEC,
+        )
+        name = cached.name
+        # Expire locally a bit before the server does so a dead handle is never used.
+        expires_at = now + max(CONTEXT_CACHE_TTL_SEC - 30, 1)
+    except asyncio.TimeoutError:
+        log.info("Gemini context cache creation timed out; sending full prompts")
+        name, expires_at = None, now + CONTEXT_CACHE_RETRY_SEC
+    except Exception as e:
+        log.info("Gemini context cache not created (%s); sending full prompts", e)
+        name, expires_at = None, now + CONTEXT_CACHE_RETRY_SEC
+
+    _context_caches[key] = (name, expires_at)
+    return name
 
 
 # --- Image + prompt Gemini call ---
 
-def generate_json_from_image(prompt: str, image_b64: str) -> Dict[str, Any]:
+async def generate_json_from_image(
+    prompt: str,
+    image_bytes: bytes,
+    mime_type: str = "image/jpeg",
+    schema: Optional[Dict[str, Any]] = None,
+    image_id: Optional[str] = None,
+    system_instruction: Optional[str] = None,
+    cached_content: Optional[str] = None,
+) -> Dict[str, Any]:
     """
     Send both text prompt and image to Gemini and return structured JSON.
     Always returns a dict — never a string.
+
+    With `schema`, Gemini is put in JSON mode and constrained to that shape,
+    so the regex-free fallback in extract_json is only hit on API oddities.
+
+    The raw image bytes go straight into the request; the SDK base64-encodes
+    them once during serialization, so callers must not pre-encode.
+
+    Successful responses are cached by sha256(prompt | image), so retries and
+    identical re-uploads skip the Gemini round-trip entirely. `image_id`
+    (sha256 of the original upload, computed once at ingress) stands in for
+    the image bytes in that key.
+
+    `cached_content` (from get_context_cache) must already hold
+    `system_instruction`; it is then not sent inline.
     """
-    contents = [
-        {"text": prompt},
-        {
-            "inline_data": {
-                "mime_type": "image/jpeg",
-                "data": image_b64,
-            }
-        },
-    ]
+    cache_key = _image_cache_key(prompt, image_bytes, image_id, system_instruction)
+    cached = await aread_cache(cache_key)
+    if cached is not None:
+        return cached
+
+    contents, config = _request(
+        prompt, image_bytes, mime_type, schema, system_instruction, cached_content
+    )
 
     try:
-        resp = client.models.generate_content(
-            model="gemini-2.0-flash",
+        resp = await _generate_content(
+            model=GEMINI_MODEL,
             contents=contents,
+            config=config,
         )
 
         # Safely extract JSON
         if hasattr(resp, "parsed") and resp.parsed:
+            if isinstance(resp.parsed, dict):
+                await awrite_cache(cache_key, resp.parsed)
             return resp.parsed  # already a dict
         elif hasattr(resp, "text"):
-            parsed = _extract_json(resp.text)
+            parsed = extract_json(resp.text)
             if parsed:
+                await awrite_cache(cache_key, parsed)
                 return parsed
             return {"error": "Gemini returned unstructured text", "raw_text": resp.text}
 
@@ -73,23 +370,160 @@ def generate_json_from_image(prompt: str, image_b64: str) -> Dict[str, Any]:
         return {"error": str(e)}
 
 
+async def generate_json_from_image_stream(
+    prompt: str,
+    image_bytes: bytes,
+    mime_type: str = "image/jpeg",
+    schema: Optional[Dict[str, Any]] = None,
+    image_id: Optional[str] = None,
+    system_instruction: Optional[str] = None,
+    cached_content: Optional[str] = None,
+) -> AsyncIterator[str]:
+    """
+    Streaming counterpart of generate_json_from_image: yields raw text chunks
+    as Gemini produces them. The caller joins and parses them at EOF.
+
+    A cached response for the same prompt+image is replayed as one chunk;
+    a complete stream that parses as JSON is written to that same cache, so
+    generate_json_from_image and this call serve each other's hits.
+    """
+    cache_key = _image_cache_key(prompt, image_bytes, image_id, system_instruction)
+    cached = await aread_cache(cache_key)
+    if cached is not None:
+        yield orjson.dumps(cached).decode()
+        return
+
+    contents, config = _request(
+        prompt, image_bytes, mime_type, schema, system_instruction, cached_content
+    )
+    stream = await _open_stream(
+        model=GEMINI_MODEL,
+        contents=contents,
+        config=config,
+    )
+    chunks: List[str] = []
+    async for chunk in stream:
+        text = getattr(chunk, "text", None)
+        if text:
+            chunks.append(text)
+            yield text
+
+    parsed = extract_json("".join(chunks))
+    if parsed:
+        await awrite_cache(cache_key, parsed)
+
+
+# --- Multi-image (batched) Gemini call ---
+
+def _batch_cache_key(prompt: str, image_bytes: bytes, tag: str) -> str:
+    # Not the image's position: the same image+tag hits in any batch.
+    return _image_cache_key(f"{prompt}|{tag}", image_bytes)
+
+
+async def read_batch_cache(
+    prompt: str, image_bytes: bytes, tag: str = ""
+) -> Optional[Dict[str, Any]]:
+    """
+    The cached generate_batch_json_from_images result for one image, so
+    callers can skip queueing it for a batch at all. None on miss.
+    """
+    return await aread_cache(_batch_cache_key(prompt, image_bytes, tag))
+
+
+async def generate_batch_json_from_images(
+    prompt: str,
+    images: List[Tuple[bytes, str]],
+    labels: Optional[List[str]] = None,
+    schema: Optional[Dict[str, Any]] = None,
+    cache_tags: Optional[List[str]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Send several (image_bytes, mime_type) images in ONE Gemini request and
+    return one dict per image, in input order. The prompt must ask for
+    {"results": [...]}; `schema` describes a single result. Each image may be
+    preceded by a text label.
+
+    Results are cached per image under sha256(prompt | tag | image), where
+    `cache_tags` holds whatever else the caller's result depends on (labels
+    usually carry the batch position, so they can't be part of the key).
+    Cached images are left out of the request.
+
+    Always returns len(images) dicts; failed slots carry an "error" key.
+    """
+    tags = cache_tags or [""] * len(images)
+    keys = [
+        _batch_cache_key(prompt, image_bytes, tag)
+        for (image_bytes, _), tag in zip(images, tags)
+    ]
+    out: List[Optional[Dict[str, Any]]] = [await aread_cache(k) for k in keys]
+    misses = [i for i, hit in enumerate(out) if hit is None]
+    if not misses:
+        return out  # type: ignore[return-value]
+
+    contents: List[Dict[str, Any]] = [{"text": prompt}]
+    for i in misses:
+        image_bytes, mime_type = images[i]
+        if labels:
+            contents.append({"text": labels[i]})
+        contents.append(_image_part(image_bytes, mime_type))
+
+    config = _json_config(
+        {
+            "type": "OBJECT",
+            "properties": {"results": {"type": "ARRAY", "items": schema}},
+            "required": ["results"],
+        }
+        if schema
+        else None
+    )
+
+    try:
+        resp = await _generate_content(
+            model=GEMINI_MODEL,
+            contents=contents,
+            config=config,
+        )
+        if hasattr(resp, "parsed") and isinstance(resp.parsed, dict):
+            data = resp.parsed
+        else:
+            data = extract_json(getattr(resp, "text", "") or "")
+        results = data.get("results")
+        if not isinstance(results, list):
+            results = [{"error": "Gemini returned no batch results"}] * len(misses)
+    except Exception as e:
+        results = [{"error": str(e)}] * len(misses)
+
+    for n, i in enumerate(misses):
+        r = results[n] if n < len(results) else {"error": "Missing batch entry"}
+        if not isinstance(r, dict):
+            r = {"error": "Malformed batch entry"}
+        elif "error" not in r:
+            await awrite_cache(keys[i], r)
+        out[i] = r
+    return out  # type: ignore[return-value]
+
+
 # --- Text-only Gemini call ---
 
-def generate_json_from_text(prompt: str) -> Dict[str, Any]:
+async def generate_json_from_text(
+    prompt: str,
+    schema: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
     """
     Send text-only prompt to Gemini and return structured JSON.
     Always returns a dict — never a string.
     """
     try:
-        resp = client.models.generate_content(
-            model="gemini-2.0-flash",
+        resp = await _generate_content(
+            model=GEMINI_MODEL,
             contents=[{"text": prompt}],
+            config=_json_config(schema),
         )
 
         if hasattr(resp, "parsed") and resp.parsed:
             return resp.parsed
         elif hasattr(resp, "text"):
-            parsed = _extract_json(resp.text)
+            parsed = extract_json(resp.text)
             if parsed:
                 return parsed
             return {"error": "Gemini returned plain text", "raw_text": resp.text}
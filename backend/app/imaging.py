@@ -0,0 +1,123 @@
+# backend/app/imaging.py
+
+import io
+from typing import List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+GEMINI_MAX_SIZE = 1024
+GEMINI_JPEG_QUALITY = 85
+
+
+# Leading magic bytes -> MIME type, for the formats Gemini accepts inline.
+_MAGIC = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+
+
+def detect_mime(image_bytes: bytes, default: str = "image/jpeg") -> str:
+    """Sniff the image MIME type from its header bytes."""
+    head = image_bytes[:16]
+    for magic, mime in _MAGIC:
+        if head.startswith(magic):
+            return mime
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return default
+
+
+def to_rgb(img: Image.Image) -> Image.Image:
+    """
+    Return `img` decoded as RGB. Most uploads already are, and convert()
+    would still copy every pixel, so RGB images are only load()ed.
+    """
+    if img.mode != "RGB":
+        return img.convert("RGB")
+    img.load()
+    return img
+
+
+def decode_image(image_bytes: bytes) -> Image.Image:
+    """
+    Decode an upload to RGB once at ingress so every agent can share the
+    same pixels instead of re-opening the bytes.
+    """
+    return to_rgb(Image.open(io.BytesIO(image_bytes)))
+
+
+_LEVELS = np.arange(256, dtype=np.float64)
+_LEVELS_SQ = _LEVELS * _LEVELS
+
+
+def channel_stats(img: Image.Image) -> Tuple[List[float], List[float]]:
+    """
+    Per-channel mean and std of an RGB image from its 3x256 histogram.
+
+    PIL builds the histogram in one native pass over the pixels; everything
+    after that is 768-element math, so no (N, 3) float copy is allocated.
+    """
+    hist = np.asarray(img.histogram(), dtype=np.float64).reshape(3, 256)
+    n = max(hist[0].sum(), 1.0)
+    means = hist @ _LEVELS / n
+    var = hist @ _LEVELS_SQ / n - means * means
+    stds = np.sqrt(np.maximum(var, 0.0))
+    return means.tolist(), stds.tolist()
+
+
+def prepare_image_for_gemini(
+    image_bytes: bytes,
+    img: Optional[Image.Image] = None,
+    max_size: int = GEMINI_MAX_SIZE,
+    quality: int = GEMINI_JPEG_QUALITY,
+) -> Tuple[bytes, str]:
+    """
+    Shrink an upload to what Gemini actually looks at before sending it.
+
+    Gemini downsamples images for vision tokens anyway, so anything larger
+    than `max_size` on its long edge is thumbnailed and re-encoded as JPEG.
+    A JPEG that already fits is passed through untouched — that check reads
+    only the header, so the common small-JPEG case never decodes pixels.
+    Oversized images are shrunk from `img` when the caller already decoded
+    them (see decode_image); otherwise JPEGs are decoded straight at reduced
+    scale via draft().
+
+    Returns (bytes, mime_type). On decode failure the original bytes are
+    returned, with their sniffed MIME type, so the caller's Gemini call
+    surfaces the real error.
+    """
+    try:
+        src = Image.open(io.BytesIO(image_bytes))
+        if src.format == "JPEG" and max(src.size) <= max_size:
+            return image_bytes, "image/jpeg"
+
+        if img is not None:
+            # thumbnail() works in place; leave the shared image untouched.
+            img = img.copy()
+        else:
+            if src.format == "JPEG":
+                # libjpeg can scale by 1/2, 1/4, 1/8 while decoding; draft
+                # picks the smallest scale that still covers max_size.
+                src.draft("RGB", (max_size, max_size))
+            img = to_rgb(src)
+        img.thumbnail((max_size, max_size), Image.LANCZOS)
+        buf = io.BytesIO()
+        img.save(buf, "JPEG", quality=quality)
+        return buf.getvalue(), "image/jpeg"
+    except Exception:
+        return image_bytes, detect_mime(image_bytes)
+
+
+def warm_up_codecs() -> None:
+    """
+    Run a tiny image through the decode and re-encode paths once, so PIL's
+    lazily registered JPEG/PNG plugins are loaded before the first upload.
+    """
+    buf = io.BytesIO()
+    Image.new("RGB", (16, 16)).save(buf, "PNG")
+    png = buf.getvalue()
+    decode_image(png)
+    prepare_image_for_gemini(png, max_size=8)
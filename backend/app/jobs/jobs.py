@@ -1,24 +1,79 @@
+import os
+import threading
+import time
 import uuid
+from collections import OrderedDict
 from typing import Dict, Any
 
-_jobs: Dict[str, Dict[str, Any]] = {}
+import orjson
 
+from ..redis_client import get_redis
 
-def create_job() -> str:
+JOB_TTL_SEC = float(os.getenv("JOB_TTL_SEC", "3600"))
+MAX_JOBS = int(os.getenv("MAX_JOBS", "10000"))
+
+# In-process store, used when REDIS_URL is not set. Insertion-ordered, so
+# the oldest job is always first in line for eviction.
+_jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def _evict_locked(now: float) -> None:
+    while _jobs:
+        oldest = next(iter(_jobs.values()))
+        if len(_jobs) < MAX_JOBS and now - oldest["created_at"] < JOB_TTL_SEC:
+            break
+        _jobs.popitem(last=False)
+
+
+def _key(job_id: str) -> str:
+    return f"job:{job_id}"
+
+
+async def create_job() -> str:
     job_id = str(uuid.uuid4())
-    _jobs[job_id] = {"status": "pending"}
+    r = get_redis()
+    if r is not None:
+        # Redis expires the key itself; no eviction pass needed.
+        await r.set(_key(job_id), orjson.dumps({"status": "pending"}), ex=int(JOB_TTL_SEC))
+        return job_id
+
+    now = time.monotonic()
+    with _lock:
+        _evict_locked(now)
+        _jobs[job_id] = {"status": "pending", "created_at": now}
     return job_id
 
 
-def set_job_result(job_id: str, result: Dict[str, Any]):
-    if job_id in _jobs:
-        _jobs[job_id] = {"status": "done", "result": result}
+async def _finish(job_id: str, state: Dict[str, Any]) -> None:
+    r = get_redis()
+    if r is not None:
+        # xx: never resurrect a job that already expired.
+        await r.set(_key(job_id), orjson.dumps(state, default=str), ex=int(JOB_TTL_SEC), xx=True)
+        return
+
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is not None:
+            _jobs[job_id] = {**state, "created_at": job["created_at"]}
+
+
+async def set_job_result(job_id: str, result: Dict[str, Any]):
+    await _finish(job_id, {"status": "done", "result": result})
+
 
+async def set_job_error(job_id: str, error: str):
+    await _finish(job_id, {"status": "error", "error": error})
 
-def set_job_error(job_id: str, error: str):
-    if job_id in _jobs:
-        _jobs[job_id] = {"status": "error", "error": error}
 
+async def get_job(job_id: str) -> Dict[str, Any]:
+    r = get_redis()
+    if r is not None:
+        raw = await r.get(_key(job_id))
+        return orjson.loads(raw) if raw is not None else {"status": "not_found"}
 
-def get_job(job_id: str) -> Dict[str, Any]:
-    return _jobs.get(job_id, {"status": "not_found"})
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            return {"status": "not_found"}
+        return {k: v for k, v in job.items() if k != "created_at"}
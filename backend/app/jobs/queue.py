@@ -0,0 +1,99 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+
+from .jobs import set_job_error, set_job_result
+
+log = logging.getLogger("thumbnail-agent")
+
+JobFn = Callable[[], Awaitable[Any]]
+
+
+class JobQueue:
+    """
+    Bounded in-process job queue drained by a fixed number of worker tasks.
+
+    Unlike BackgroundTasks, at most `workers` jobs run at once and a full
+    queue is reported to the caller instead of piling up unbounded work.
+
+    It is NOT durable or isolated: jobs live in this process's memory and
+    are lost on restart or crash, and workers run on the same event loop
+    as request handling, so job work still competes with requests. It is
+    the fallback for single-process setups without REDIS_URL; see ArqJobQueue.
+    """
+
+    def __init__(self, workers: int = 2, maxsize: int = 100):
+        self.workers = workers
+        self._queue: "asyncio.Queue[Tuple[str, JobFn]]" = asyncio.Queue(maxsize)
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, job_id: str, fn: JobFn) -> bool:
+        """Enqueue `fn` for `job_id`; False if the queue is full."""
+        try:
+            self._queue.put_nowait((job_id, fn))
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    async def _worker(self) -> None:
+        while True:
+            job_id, fn = await self._queue.get()
+            try:
+                await set_job_result(job_id, await fn())
+            except asyncio.CancelledError:
+                await set_job_error(job_id, "Server shutting down")
+                raise
+            except Exception as e:
+                log.error("Job %s failed: %s", job_id, e)
+                await set_job_error(job_id, str(e))
+            finally:
+                self._queue.task_done()
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+
+class ArqJobQueue:
+    """
+    Hands jobs to out-of-process arq workers through Redis (see
+    jobs/worker.py), so queued jobs survive API restarts and pipelines run
+    on dedicated worker processes instead of the request event loop.
+
+    Job status and results go to the Redis job store (jobs.py), which every
+    API worker reads.
+    """
+
+    def __init__(self, redis_url: str):
+        self.redis_url = redis_url
+        self._pool: Optional[Any] = None
+
+    async def _get_pool(self) -> Any:
+        if self._pool is None:
+            try:
+                from arq import create_pool
+                from arq.connections import RedisSettings
+            except ImportError as e:
+                raise RuntimeError("REDIS_URL is set but the 'arq' package is not installed.") from e
+            self._pool = await create_pool(RedisSettings.from_dsn(self.redis_url))
+        return self._pool
+
+    async def submit(self, job_id: str, function: str, *args: Any) -> bool:
+        """Enqueue worker `function`(job_id, *args); False if `job_id` is already queued."""
+        pool = await self._get_pool()
+        job = await pool.enqueue_job(function, job_id, *args, _job_id=job_id)
+        return job is not None
+
+    async def stop(self) -> None:
+        if self._pool is not None:
+            await self._pool.aclose()
+            self._pool = None
@@ -0,0 +1,68 @@
+# backend/app/jobs/worker.py
+#
+# arq worker for /analyze_async jobs when REDIS_URL is set. Run it next to
+# the API, pointed at the same Redis:
+#
+#     arq backend.app.jobs.worker.WorkerSettings
+
+import os
+from typing import Any, Dict, Optional
+
+from arq.connections import RedisSettings
+from fastapi import HTTPException
+
+from .. import gemini_client
+from ..imaging import warm_up_codecs
+from ..logging_config import log
+from ..main import _analyze_thumbnail_impl
+from ..memory.memory import shutdown as shutdown_memory
+from ..redis_client import REDIS_URL, close_redis
+from ..workers import shutdown_cpu_pool, start_cpu_pool
+from .jobs import set_job_error, set_job_result
+
+
+async def analyze_job_worker(
+    ctx: Dict[str, Any],
+    job_id: str,
+    img_bytes: bytes,
+    title: str,
+    description: str,
+    session_id: Optional[str],
+    mode: str,
+) -> None:
+    """Run the /analyze pipeline for a queued job and record its outcome."""
+    try:
+        result = await _analyze_thumbnail_impl(
+            img_bytes, title, description, session_id, mode
+        )
+    except HTTPException as e:
+        await set_job_error(job_id, str(e.detail))
+        return
+    except Exception as e:
+        log.error("Job %s failed: %s", job_id, e)
+        await set_job_error(job_id, str(e))
+        return
+    await set_job_result(job_id, result)
+
+
+async def startup(ctx: Dict[str, Any]) -> None:
+    await start_cpu_pool()
+    warm_up_codecs()
+
+
+async def shutdown(ctx: Dict[str, Any]) -> None:
+    shutdown_cpu_pool()
+    shutdown_memory()
+    await gemini_client.aclose()
+    await close_redis()
+
+
+class WorkerSettings:
+    functions = [analyze_job_worker]
+    on_startup = startup
+    on_shutdown = shutdown
+    redis_settings = RedisSettings.from_dsn(REDIS_URL or "redis://localhost:6379")
+    max_jobs = int(os.getenv("JOB_WORKERS", "2"))
+    job_timeout = int(os.getenv("JOB_TIMEOUT_SEC", "300"))
+    # Outcomes live in the job store (jobs.py), not in arq's result keys.
+    keep_result = 0
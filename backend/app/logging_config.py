@@ -10,6 +10,14 @@ logging.basicConfig(
 
 log = logging.getLogger("thumbnail-agent")
 
+
+class SessionLogger(logging.LoggerAdapter):
+    """Prefixes records with the request's session id (bound once per handler)."""
+
+    def process(self, msg, kwargs):
+        return f"[session={self.extra['session_id']}] {msg}", kwargs
+
+
 MetricValue = Union[int, float]
 _metrics: Dict[str, MetricValue] = {}
 
@@ -33,5 +41,5 @@ def measure(name: str):
         yield
     finally:
         elapsed_ms = (time.time() - start) * 1000
-        log.info(f"{name} took {elapsed_ms:.1f}ms")
+        log.info("%s took %.1fms", name, elapsed_ms)
         _metrics[f"time_ms_last_{name}"] = round(elapsed_ms, 1)
@@ -4,28 +4,51 @@ import os
 
 load_dotenv()  # Loads .env automatically
 
-from typing import Optional, Dict, Any, List
+from typing import Awaitable, Callable, Optional, Dict, Any, List
 
 import asyncio
-import base64
+import bisect
+import copy
+import hashlib
+import re
+import orjson
 from fastapi import (
     FastAPI,
     UploadFile,
     File,
     Form,
     HTTPException,
-    BackgroundTasks,
+    Query,
 )
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 
 from .agents.vision_agent import run_vision_agent
 from .agents.heuristic_agent import run_heuristic_agent
-from .agents.coach_agent import run_coach_agent
+from .agents.coach_agent import (
+    get_coach_context_cache,
+    run_coach_agent,
+    run_coach_batch,
+    cached_coach_batch_review,
+    stream_coach_agent,
+)
 from .agents.engagement_agent import run_engagement_agent
 
-from .logging_config import log, get_metrics_snapshot
-from .memory.memory import get_or_create_session, append_event, summarize_history
-from .jobs.jobs import create_job, set_job_result, set_job_error, get_job
+from .imaging import decode_image, prepare_image_for_gemini, warm_up_codecs
+from . import gemini_client, response_cache
+from .cache import TTLCache
+from .logging_config import SessionLogger, log, get_metrics_snapshot
+from .memory.memory import (
+    get_or_create_session,
+    append_event,
+    summarize_history,
+    shutdown as shutdown_memory,
+)
+from .jobs.jobs import create_job, set_job_error, get_job
+from .jobs.queue import ArqJobQueue, JobQueue
+from .jobs.batcher import MicroBatcher
+from .redis_client import REDIS_URL, close_redis
+from .workers import shutdown_cpu_pool, start_cpu_pool
 
 
 app = FastAPI(title="Gemini Thumbnail Reviewer AI", version="4.0")
@@ -39,11 +62,169 @@ app.add_middleware(
 )
 
 
+# Workers for /analyze_async jobs. With REDIS_URL, jobs go to separate arq
+# worker processes (jobs/worker.py) and survive restarts. Without it they
+# run as in-process tasks on this event loop, capped at JOB_WORKERS
+# concurrent pipelines, and queued or running jobs are lost if the process exits.
+_arq_queue: Optional[ArqJobQueue] = ArqJobQueue(REDIS_URL) if REDIS_URL else None
+_job_queue = JobQueue(
+    workers=int(os.getenv("JOB_WORKERS", "2")),
+    maxsize=int(os.getenv("JOB_QUEUE_MAX", "100")),
+)
+
+GEMINI_WARMUP_TIMEOUT_SEC = float(os.getenv("GEMINI_WARMUP_TIMEOUT_SEC", "10"))
+
+
+@app.on_event("startup")
+async def startup():
+    # Heuristic pixel work runs here (see run_heuristic_agent).
+    app.state.cpu_pool = await start_cpu_pool()
+    # Shared, pooled Gemini client used by every agent.
+    app.state.gemini = gemini_client.client
+    if _arq_queue is None:
+        _job_queue.start()
+    # Pay codec loading and the Gemini connection handshake here rather
+    # than inside the first request.
+    warm_up_codecs()
+    try:
+        await asyncio.wait_for(gemini_client.warm_up(), GEMINI_WARMUP_TIMEOUT_SEC)
+    except asyncio.TimeoutError:
+        log.warning("Gemini warm-up timed out after %ss", GEMINI_WARMUP_TIMEOUT_SEC)
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await _job_queue.stop()
+    if _arq_queue is not None:
+        await _arq_queue.stop()
+    shutdown_cpu_pool()
+    shutdown_memory()
+    await gemini_client.aclose()
+    await close_redis()
+
+
 # ==========================================================
 #                    MAIN ANALYSIS PIPELINE
 # ==========================================================
 
 
+# Phrases that mark Gemini's verdict as modern/creator-grade; one
+# case-insensitive pass over the summary instead of a scan per keyword.
+MODERN_KEYWORDS = (
+    "modern",
+    "professional",
+    "clean",
+    "cinematic",
+    "high quality",
+    "creator-grade",
+    "well-designed",
+    "already strong",
+    "looks current",
+    "contemporary",
+    "polished",
+    "strong thumbnail",
+)
+_MODERN_RE = re.compile("|".join(map(re.escape, MODERN_KEYWORDS)), re.IGNORECASE)
+MODERN_BONUS = 1.2
+
+# Review headline by final score: _TOP_LINES[i] covers scores from
+# _TOP_LINE_THRESHOLDS[i - 1] up to (not including) _TOP_LINE_THRESHOLDS[i].
+_TOP_LINE_THRESHOLDS = (5.5, 7.0, 8.5)
+_TOP_LINES = (
+    "Thumbnail needs a clearer, more modern redesign to feel competitive.",
+    "Thumbnail is understandable, but needs visual upgrades to compete in today’s feed.",
+    "Solid thumbnail that can be pushed further with a few targeted changes.",
+    "Already a strong modern thumbnail; the ideas below are optional optimizations.",
+)
+
+
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(8 * 1024 * 1024)))
+UPLOAD_CHUNK_BYTES = 64 * 1024
+
+
+async def _read_bounded(file: UploadFile, limit: int = MAX_UPLOAD_BYTES) -> bytes:
+    """
+    Read an upload in chunks, failing with 413 as soon as it passes `limit`
+    instead of buffering an arbitrarily large body first.
+    """
+    buf = bytearray()
+    while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+        buf += chunk
+        if len(buf) > limit:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Upload too large (max {limit // (1024 * 1024)} MB)",
+            )
+    return bytes(buf)
+
+
+def review_lines(review: Any) -> List[str]:
+    """Flatten a structured review into the pre-dict list of sentences."""
+    if not isinstance(review, dict):
+        return list(review or [])
+    lines = [review["top_line"]]
+    if review.get("ai_perspective"):
+        lines.append(f"AI perspective: {review['ai_perspective']}")
+    if review.get("strengths"):
+        lines.append(f"Strengths: {'; '.join(review['strengths'])}.")
+    if review.get("improvements"):
+        lines.append(f"Improvements: {'; '.join(review['improvements'])}.")
+    eng = review.get("engagement")
+    if eng:
+        lines.append(f"Engagement outlook {eng['score']}/10 – {eng['text']}")
+    return lines
+
+
+# Vision and heuristic output depend on the pixels alone, so a re-upload
+# with a new title/description reuses them; only coach/engagement re-run.
+_stage_cache = TTLCache(
+    maxsize=512, ttl_sec=float(os.getenv("STAGE_CACHE_TTL_SEC", "3600"))
+)
+
+
+async def _cached_stage(
+    stage: str, image_id: str, run: Callable[[], Awaitable[Dict[str, Any]]]
+) -> Dict[str, Any]:
+    """Run an image-only agent stage, memoized by upload hash. Errors aren't cached."""
+    key = f"{stage}:{image_id}"
+    hit = _stage_cache.get(key)
+    if hit is not None:
+        return copy.deepcopy(hit)
+    out = await run()
+    if isinstance(out, dict) and "error" not in out:
+        _stage_cache.set(key, copy.deepcopy(out))
+    return out
+
+
+def _safe_float(value: Any, default: float = 0.0) -> float:
+    """Agent score -> float; missing, null or malformed values become `default`."""
+    if value is None:
+        return default
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _round1(value: Any) -> Optional[float]:
+    """Metric for the UI: one decimal, or None when the agent didn't provide it."""
+    if value is None:
+        return None
+    return round(_safe_float(value), 1)
+
+
+async def _decode_upload(img_bytes: bytes):
+    """
+    Decode the upload off the event loop. Returns None for undecodable
+    bytes so each agent hits (and reports) the decode error itself.
+    """
+    try:
+        return await asyncio.to_thread(decode_image, img_bytes)
+    except Exception as e:
+        log.warning("Could not decode upload: %s", e)
+        return None
+
+
 @app.post("/api/v1/thumbnail/analyze")
 async def analyze_thumbnail(
     file: UploadFile = File(...),
@@ -51,58 +232,144 @@ async def analyze_thumbnail(
     description: str = Form(""),
     session_id: Optional[str] = Form(None),
     mode: str = Form("quick"),  # "quick" | "deep"
+    cache_control: str = Form(""),  # "no-cache" forces a fresh analysis
+    response_format: str = Query("", alias="format"),  # "legacy" adds review_lines
 ):
     """
     Run the complete analysis pipeline on one thumbnail.
 
     mode = "quick"  -> normal timeouts
     mode = "deep"   -> slightly longer timeouts so Gemini can think more.
+
+    Re-submitting a near-identical image (perceptual hash) with the same
+    title/description in the same session returns the cached result
+    without running any agent, unless cache_control is "no-cache".
+
+    `review` is a structured dict; with ?format=legacy the old flat list of
+    review sentences is added as `review_lines`.
     """
+    # Oversized uploads are rejected (413) before any work is done.
+    img_bytes = await _read_bounded(file)
+    result = await _analyze_thumbnail_impl(
+        img_bytes, title, description, session_id, mode, cache_control
+    )
+    if response_format == "legacy":
+        result = {**result, "review_lines": review_lines(result.get("review"))}
+    return result
+
+
+async def _analyze_thumbnail_impl(
+    img_bytes: bytes,
+    title: str = "",
+    description: str = "",
+    session_id: Optional[str] = None,
+    mode: str = "quick",
+    cache_control: str = "",
+) -> Dict[str, Any]:
+    """The /analyze pipeline on already-read upload bytes."""
     try:
-        # Read bytes & get session context
-        img_bytes = await file.read()
-        session_id = get_or_create_session(session_id)
-        history_text = summarize_history(session_id)
+        # Get session context
+        # Hash once here; agents reuse it as their cache key.
+        image_id = hashlib.sha256(img_bytes).hexdigest()
+        session_id = await get_or_create_session(session_id)
+        history_text = await summarize_history(session_id)
+
+        slog = SessionLogger(log, {"session_id": session_id})
 
         results: Dict[str, Any] = {}
-        log.info(f"🚀 Starting thumbnail analysis pipeline (mode={mode})")
+        slog.info("Starting analysis pipeline mode=%s", mode)
 
-        # ---------------- 1. Vision Agent ----------------
-        try:
-            log.info("🧠 Running Vision Agent...")
-            results["vision"] = await asyncio.wait_for(
-                run_vision_agent(img_bytes),
-                timeout=25 if mode == "quick" else 35,
-            )
-            log.info("✅ Vision Agent complete")
-        except Exception as e:
-            log.error(f"❌ Vision Agent failed: {e}")
-            results["vision"] = {"agent": "vision", "error": str(e)}
+        # Decode once; vision, heuristics and Gemini prep all share it.
+        pil_img = await _decode_upload(img_bytes)
 
-        # ---------------- 2. Heuristic Agent -------------
-        try:
-            log.info("🔍 Running Heuristic Agent...")
-            results["heuristic"] = await asyncio.wait_for(
-                run_heuristic_agent(img_bytes, title, description),
-                timeout=20,
-            )
-            log.info("✅ Heuristic Agent complete")
-        except Exception as e:
-            log.error(f"❌ Heuristic Agent failed: {e}")
-            results["heuristic"] = {
-                "agent": "heuristic",
-                "error": str(e),
-                "score": 0.0,
-                "summary": "Heuristic analysis failed.",
-                "details": [],
-                "metrics": {},
-            }
+        if pil_img is not None and cache_control != "no-cache":
+            try:
+                cached = await asyncio.to_thread(
+                    response_cache.lookup, session_id, pil_img, title, description, mode
+                )
+            except Exception as e:
+                slog.warning("Response cache lookup failed: %s", e)
+                cached = None
+            if cached is not None:
+                slog.info("Returning cached analysis (near-duplicate upload)")
+                # Still a submission: record it so session history stays complete.
+                coach_summary = (
+                    ((cached.get("agents") or {}).get("coach") or {}).get("summary") or ""
+                ).strip()
+                await append_event(
+                    session_id,
+                    {
+                        "score": cached.get("score"),
+                        "summary": coach_summary
+                        or (cached.get("review") or {}).get("top_line", ""),
+                        "title": title,
+                    },
+                )
+                return cached
+
+        # Downscale/re-encode once for every Gemini-bound agent; overlaps
+        # with the heuristic agent below.
+        gemini_task = asyncio.create_task(
+            asyncio.to_thread(prepare_image_for_gemini, img_bytes, pil_img)
+        )
+
+        # Resolve the coach's prompt cache alongside phase 1 rather than in
+        # front of the coach call (it is a dict hit after the first request).
+        coach_cache_task = asyncio.create_task(get_coach_context_cache())
+
+        # ------- 1+2. Vision & Heuristic Agents (parallel) -------
+        # Neither depends on the other; both are only context for the coach,
+        # so run them side by side and pay max(T_vision, T_heuristic).
+        async def _vision_stage() -> Dict[str, Any]:
+            try:
+                slog.info("Running vision agent")
+                gemini_bytes, gemini_mime = await gemini_task
+                out = await asyncio.wait_for(
+                    run_vision_agent(
+                        img_bytes,
+                        gemini_bytes,
+                        gemini_mime,
+                        image_id=image_id,
+                        pil_img=pil_img,
+                    ),
+                    timeout=25 if mode == "quick" else 35,
+                )
+                slog.info("Vision agent complete")
+                return out
+            except Exception as e:
+                slog.error("Vision agent failed: %s", e)
+                return {"agent": "vision", "error": str(e)}
+
+        async def _heuristic_stage() -> Dict[str, Any]:
+            try:
+                slog.info("Running heuristic agent")
+                out = await asyncio.wait_for(
+                    run_heuristic_agent(img_bytes, title, description, pil_img),
+                    timeout=20,
+                )
+                slog.info("Heuristic agent complete")
+                return out
+            except Exception as e:
+                slog.error("Heuristic agent failed: %s", e)
+                return {
+                    "agent": "heuristic",
+                    "error": str(e),
+                    "score": 0.0,
+                    "summary": "Heuristic analysis failed.",
+                    "details": [],
+                    "metrics": {},
+                }
+
+        results["vision"], results["heuristic"] = await asyncio.gather(
+            _cached_stage("vision", image_id, _vision_stage),
+            _cached_stage("heuristic", image_id, _heuristic_stage),
+        )
 
         # ---------------- 3. Coach Agent (Gemini) --------
         try:
-            log.info("🎯 Running Coach Agent.")
-            image_b64 = base64.b64encode(img_bytes).decode("utf-8")
-
+            slog.info("Running coach agent")
+            gemini_bytes, gemini_mime = await gemini_task
+            coach_cache = await coach_cache_task
             coach_result = await asyncio.wait_for(
                 run_coach_agent(
                     title=title,
@@ -110,7 +377,10 @@ async def analyze_thumbnail(
                     vision=results.get("vision", {}),
                     heuristic=results.get("heuristic", {}),
                     history_summary=history_text,
-                    image_b64=image_b64,
+                    image_bytes=gemini_bytes,
+                    mime_type=gemini_mime,
+                    image_id=image_id,
+                    cached_content_name=coach_cache,
                 ),
                 timeout=45 if mode == "quick" else 60,
             )
@@ -126,13 +396,13 @@ async def analyze_thumbnail(
                 }
 
             results["coach"] = coach_result
-            log.info(
-                "✅ Coach Agent complete (score: %s)",
+            slog.info(
+                "Coach agent complete score=%s",
                 coach_result.get("quality_score", 0),
             )
 
         except asyncio.TimeoutError:
-            log.error("⏰ Coach Agent timed out")
+            slog.error("Coach agent timed out")
             results["coach"] = {
                 "agent": "coach",
                 "error": "Coach agent timeout",
@@ -142,7 +412,7 @@ async def analyze_thumbnail(
                 "improvements": [],
             }
         except Exception as e:
-            log.error(f"❌ Coach Agent failed: {e}")
+            slog.error("Coach agent failed: %s", e)
             results["coach"] = {
                 "agent": "coach",
                 "error": str(e),
@@ -154,7 +424,7 @@ async def analyze_thumbnail(
 
         # ---------------- 4. Engagement Agent ------------
         try:
-            log.info("📈 Running Engagement Agent.")
+            slog.info("Running engagement agent")
             results["engagement"] = await asyncio.wait_for(
                 run_engagement_agent(
                     vision=results.get("vision", {}),
@@ -163,9 +433,9 @@ async def analyze_thumbnail(
                 ),
                 timeout=15 if mode == "quick" else 20,
             )
-            log.info("✅ Engagement Agent complete")
+            slog.info("Engagement agent complete")
         except Exception as e:
-            log.error(f"❌ Engagement Agent failed: {e}")
+            slog.error("Engagement agent failed: %s", e)
             results["engagement"] = {
                 "agent": "engagement",
                 "error": str(e),
@@ -175,11 +445,12 @@ async def analyze_thumbnail(
 
         # ---------------- 5. SCORING + REVIEW ------------
         try:
-            heur_score = float(results.get("heuristic", {}).get("score", 0) or 0)
-            coach = results.get("coach", {}) or {}
-            coach_raw = float(coach.get("quality_score", 0) or 0)
-            engage_score = float(
-                results.get("engagement", {}).get("engagement_score", 0) or 0
+            heuristic = results.get("heuristic") or {}
+            coach = results.get("coach") or {}
+            heur_score = _safe_float(heuristic.get("score"))
+            coach_raw = _safe_float(coach.get("quality_score"))
+            engage_score = _safe_float(
+                (results.get("engagement") or {}).get("engagement_score")
             )
 
             # ---------- a) Map Gemini quality into 0–10 ----------
@@ -198,25 +469,9 @@ async def analyze_thumbnail(
             # ---------- c) Modern-meta calibration ----------
             # If Gemini itself calls this modern/professional/clean/etc,
             # we treat it as creator-grade and bump above average.
-            coach_text = (coach.get("summary") or "").lower()
-
-            modern_keywords = [
-                "modern",
-                "professional",
-                "clean",
-                "cinematic",
-                "high quality",
-                "creator-grade",
-                "well-designed",
-                "already strong",
-                "looks current",
-                "contemporary",
-                "polished",
-                "strong thumbnail",
-            ]
-
-            if any(kw in coach_text for kw in modern_keywords):
-                final_score += 1.2
+            coach_text = coach.get("summary") or ""
+
+            final_score += MODERN_BONUS * bool(_MODERN_RE.search(coach_text))
 
             # Clamp & round
             final_score = round(max(0.0, min(final_score, 10.0)), 1)
@@ -224,79 +479,44 @@ async def analyze_thumbnail(
             # ---------- d) Build designer-friendly review ----------
             model_summary = (coach.get("summary") or "").strip()
 
-            if final_score >= 8.5:
-                top_line = (
-                    "Already a strong modern thumbnail; the ideas below are optional optimizations."
-                )
-            elif final_score >= 7.0:
-                top_line = (
-                    "Solid thumbnail that can be pushed further with a few targeted changes."
-                )
-            elif final_score >= 5.5:
-                top_line = (
-                    "Thumbnail is understandable, but needs visual upgrades to compete in today’s feed."
-                )
-            else:
-                top_line = (
-                    "Thumbnail needs a clearer, more modern redesign to feel competitive."
-                )
-
-            ai_line = (
-                f"AI perspective: {model_summary}"
-                if model_summary and model_summary.lower() not in top_line.lower()
-                else ""
-            )
+            top_line = _TOP_LINES[bisect.bisect_right(_TOP_LINE_THRESHOLDS, final_score)]
 
             positives = coach.get("positives") or []
             improvements = coach.get("improvements") or []
             engagement = results.get("engagement", {}) or {}
-
-            review: List[str] = []
-            review.append(top_line)
-            if ai_line:
-                review.append(ai_line)
-
-            if positives:
-                review.append(
-                    "Strengths: " + "; ".join(str(p) for p in positives[:3]) + "."
-                )
-            if improvements:
-                review.append(
-                    "Improvements: "
-                    + "; ".join(str(i) for i in improvements[:4])
-                    + "."
-                )
-
             es = engagement.get("engagement_score")
-            if es is not None:
-                eng_line = engagement.get("summary") or f"Predicted engagement: {es}/10."
-                review.append(f"Engagement outlook {es}/10 – {eng_line}")
+
+            review = {
+                "top_line": top_line,
+                "ai_perspective": model_summary
+                if model_summary and model_summary.lower() not in top_line.lower()
+                else None,
+                "strengths": [str(p) for p in positives[:3]],
+                "improvements": [str(i) for i in improvements[:4]],
+                "engagement": {
+                    "score": es,
+                    "text": engagement.get("summary")
+                    or f"Predicted engagement: {es}/10.",
+                }
+                if es is not None
+                else None,
+            }
 
             # ---------- e) Quick metrics for UI ----------
-            heur_metrics = results.get("heuristic", {}).get("metrics", {}) or {}
-            brightness = heur_metrics.get("brightness")
-            contrast = heur_metrics.get("contrast")
-            aspect_fit = heur_metrics.get("aspect_ratio_fit")
+            heur_metrics = heuristic.get("metrics") or {}
 
             meta = {
                 "session_id": session_id,
                 "heuristics": {
-                    "brightness": round(float(brightness), 1)
-                    if brightness is not None
-                    else None,
-                    "contrast": round(float(contrast), 1)
-                    if contrast is not None
-                    else None,
-                    "aspect_ratio_fit": round(float(aspect_fit), 1)
-                    if aspect_fit is not None
-                    else None,
+                    name: _round1(heur_metrics.get(name))
+                    for name in ("brightness", "contrast", "aspect_ratio_fit")
                 },
                 "agents": results,
                 "gemini_used": "error" not in coach,
             }
 
             # ---------- f) Memory ----------
-            append_event(
+            await append_event(
                 session_id,
                 {
                     "score": final_score,
@@ -305,9 +525,9 @@ async def analyze_thumbnail(
                 },
             )
 
-            log.info(f"🏁 Analysis complete — Final Score: {final_score}/10")
+            slog.info("Analysis complete score=%s", final_score)
 
-            return {
+            response = {
                 "status": "done",
                 "score": final_score,
                 "review": review,
@@ -316,15 +536,214 @@ async def analyze_thumbnail(
                 "session_id": session_id,
             }
 
+            # Only cache complete analyses; a degraded result would otherwise
+            # be replayed to every near-duplicate upload for the cache TTL.
+            degraded = any(
+                "error" in (results.get(stage) or {}) for stage in ("vision", "coach")
+            ) or "error" in ((results.get("coach") or {}).get("raw") or {})
+            if pil_img is not None and not degraded:
+                try:
+                    await asyncio.to_thread(
+                        response_cache.store,
+                        session_id,
+                        pil_img,
+                        title,
+                        description,
+                        mode,
+                        response,
+                    )
+                except Exception as e:
+                    slog.warning("Response cache store failed: %s", e)
+
+            return response
+
         except Exception as e:
-            log.error(f"⚠️ Scoring failed: {e}")
+            slog.error("Scoring failed: %s", e)
             raise HTTPException(status_code=500, detail=f"Scoring failed: {e}")
 
     except Exception as e:
-        log.error(f"💥 Pipeline error: {e}")
+        log.error("Pipeline error: %s", e)
         raise HTTPException(status_code=500, detail=f"Pipeline error: {e}")
 
 
+# ==========================================================
+#              STREAMING COACH REVIEW (SSE)
+# ==========================================================
+
+
+def _sse(payload: Dict[str, Any]) -> str:
+    return f"data: {orjson.dumps(payload, default=str).decode()}\n\n"
+
+
+@app.post("/api/v1/thumbnail/analyze_stream")
+async def analyze_thumbnail_stream(
+    file: UploadFile = File(...),
+    title: str = Form(""),
+    description: str = Form(""),
+    session_id: Optional[str] = Form(None),
+):
+    """
+    Server-sent events variant of the review.
+
+    Emits the vision + heuristic context first, then {"token": ...} events
+    while the coach is writing, and finally {"coach": {...}} with the parsed
+    coach result, so the UI can render the verdict before Gemini finishes.
+
+    A completed review is recorded in the session history like /analyze.
+    The coach response lands in the Gemini response cache; the near-duplicate
+    response cache is not written, since it holds full /analyze responses
+    (final score, engagement) that this endpoint never computes.
+    """
+    img_bytes = await _read_bounded(file)
+    image_id = hashlib.sha256(img_bytes).hexdigest()
+    session_id = await get_or_create_session(session_id)
+    history_text = await summarize_history(session_id)
+    pil_img = await _decode_upload(img_bytes)
+    gemini_bytes, gemini_mime = await asyncio.to_thread(
+        prepare_image_for_gemini, img_bytes, pil_img
+    )
+
+    vision, heuristic, coach_cache = await asyncio.gather(
+        _cached_stage(
+            "vision",
+            image_id,
+            lambda: run_vision_agent(
+                img_bytes, gemini_bytes, gemini_mime, image_id=image_id, pil_img=pil_img
+            ),
+        ),
+        _cached_stage(
+            "heuristic",
+            image_id,
+            lambda: run_heuristic_agent(img_bytes, title, description, pil_img),
+        ),
+        get_coach_context_cache(),
+    )
+
+    async def events():
+        yield _sse({"session_id": session_id, "vision": vision, "heuristic": heuristic})
+        async for event in stream_coach_agent(
+            title=title,
+            description=description,
+            vision=vision,
+            heuristic=heuristic,
+            history_summary=history_text,
+            image_bytes=gemini_bytes,
+            mime_type=gemini_mime,
+            image_id=image_id,
+            cached_content_name=coach_cache,
+        ):
+            yield _sse(event)
+            coach = event.get("coach")
+            if coach is not None and "error" not in coach:
+                await append_event(
+                    session_id,
+                    {
+                        "score": coach.get("quality_score"),
+                        "summary": (coach.get("summary") or "").strip(),
+                        "title": title,
+                    },
+                )
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+# ==========================================================
+#              MULTI-THUMBNAIL BATCH (NDJSON)
+# ==========================================================
+
+ANALYZE_BATCH_MAX = int(os.getenv("ANALYZE_BATCH_MAX", "32"))
+
+
+@app.post("/api/v1/thumbnail/analyze_batch")
+async def analyze_thumbnail_batch(
+    files: List[UploadFile] = File(...),
+    title: str = Form(""),
+    description: str = Form(""),
+    session_id: Optional[str] = Form(None),
+    mode: str = Form("quick"),
+):
+    """
+    Run the /analyze pipeline on several thumbnails at once.
+
+    All images share one session and run concurrently; Gemini calls are
+    still capped by the process-wide Gemini semaphore and pixel work by the
+    CPU pool. The response is JSON Lines, one
+    {"index", "filename", "result" | "error"} object per image, written as
+    soon as each analysis finishes (so not in upload order).
+    """
+    if len(files) > ANALYZE_BATCH_MAX:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {ANALYZE_BATCH_MAX} images per batch",
+        )
+    uploads = [(f.filename, await _read_bounded(f)) for f in files]
+    session_id = await get_or_create_session(session_id)
+
+    async def run_one(index: int, filename: Optional[str], img_bytes: bytes):
+        item: Dict[str, Any] = {"index": index, "filename": filename}
+        try:
+            item["result"] = await _analyze_thumbnail_impl(
+                img_bytes, title, description, session_id, mode
+            )
+        except HTTPException as e:
+            item["error"] = e.detail
+        except Exception as e:
+            item["error"] = str(e)
+        return item
+
+    async def lines():
+        tasks = [
+            asyncio.ensure_future(run_one(i, name, data))
+            for i, (name, data) in enumerate(uploads)
+        ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield orjson.dumps(await next_done, default=str) + b"\n"
+        finally:
+            # Client went away mid-stream: don't keep analyzing for nobody.
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+# ==========================================================
+#              MICRO-BATCHED COACH REVIEW
+# ==========================================================
+
+# Concurrent /review/batch calls arriving within the window share one
+# multi-image Gemini request instead of paying per-request overhead each.
+_coach_batcher = MicroBatcher(
+    run_coach_batch,
+    max_batch=int(os.getenv("REVIEW_BATCH_MAX", "8")),
+    window_sec=float(os.getenv("REVIEW_BATCH_WINDOW_MS", "50")) / 1000.0,
+)
+
+
+@app.post("/api/v1/thumbnail/review/batch")
+async def review_thumbnail_batched(
+    file: UploadFile = File(...),
+    title: str = Form(""),
+):
+    """
+    Coach-only review of one thumbnail, micro-batched with other requests.
+    """
+    img_bytes = await _read_bounded(file)
+    gemini_bytes, gemini_mime = await asyncio.to_thread(
+        prepare_image_for_gemini, img_bytes
+    )
+    # A repeat upload is answered from cache without waiting for a batch.
+    coach = await cached_coach_batch_review(gemini_bytes, title)
+    if coach is not None:
+        return {"status": "done", "coach": coach}
+    try:
+        coach = await _coach_batcher.submit((gemini_bytes, gemini_mime, title))
+    except Exception as e:
+        log.error("Batched coach review failed: %s", e)
+        raise HTTPException(status_code=500, detail=f"Batch review error: {e}")
+    return {"status": "done", "coach": coach}
+
+
 # ==========================================================
 #             OPTIONAL ASYNC JOB HANDLER
 # ==========================================================
@@ -332,7 +751,6 @@ async def analyze_thumbnail(
 
 @app.post("/api/v1/thumbnail/analyze_async")
 async def analyze_thumbnail_async(
-    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     title: str = Form(""),
     description: str = Form(""),
@@ -340,24 +758,52 @@ async def analyze_thumbnail_async(
     mode: str = Form("deep"),
 ):
     """
-    Async wrapper around analyze_thumbnail.
+    Async wrapper around analyze_thumbnail: queues the job and returns its
+    id immediately. Poll /api/v1/jobs/{job_id} for the result.
+
+    With REDIS_URL set, the job is picked up by an arq worker process
+    (`arq backend.app.jobs.worker.WorkerSettings`). Otherwise the queue is
+    in-process and best-effort: a job still queued or running when the
+    server restarts never completes.
     """
-    job_id = create_job()
+    # The job outlives this request, so it captures plain bytes rather than
+    # Starlette's temp file.
+    img_bytes = await _read_bounded(file)
+    job_id = await create_job()
 
-    async def run_background():
+    if _arq_queue is not None:
         try:
-            result = await analyze_thumbnail(file, title, description, session_id, mode)
-            set_job_result(job_id, result)
+            queued = await _arq_queue.submit(
+                job_id,
+                "analyze_job_worker",
+                img_bytes,
+                title,
+                description,
+                session_id,
+                mode,
+            )
         except Exception as e:
-            set_job_error(job_id, str(e))
-
-    background_tasks.add_task(run_background)
+            log.error("Enqueueing job %s failed: %s", job_id, e)
+            queued = False
+        if not queued:
+            await set_job_error(job_id, "Could not enqueue job")
+            raise HTTPException(status_code=503, detail="Job queue unavailable, retry later")
+        return {"job_id": job_id, "status": "queued"}
+
+    async def run_job():
+        return await _analyze_thumbnail_impl(
+            img_bytes, title, description, session_id, mode
+        )
+
+    if not _job_queue.submit(job_id, run_job):
+        await set_job_error(job_id, "Job queue full")
+        raise HTTPException(status_code=503, detail="Job queue full, retry later")
     return {"job_id": job_id, "status": "queued"}
 
 
 @app.get("/api/v1/jobs/{job_id}")
 async def get_job_status(job_id: str):
-    job = get_job(job_id)
+    job = await get_job(job_id)
     if not job:
         raise HTTPException(status_code=404, detail="Job not found")
     return job
@@ -1,66 +1,361 @@
+import asyncio
+import itertools
+import logging
 import uuid
-import json
 import os
-from typing import Dict, List, Any
-from collections import defaultdict
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Set
 
+import orjson
+
+from ..logging_config import inc_metric, set_metric
+from ..redis_client import get_redis
+
+log = logging.getLogger("thumbnail-agent")
+
+# Compacted snapshot of all sessions (one JSON line per session), plus an
+# append-only log of everything since. Requests only ever append one line;
+# the log is folded into the snapshot in the background every
+# COMPACT_EVERY_SEC / COMPACT_EVERY_EVENTS.
 MEMORY_PATH = os.path.join(os.path.dirname(__file__), "memory_store.json")
+WAL_PATH = os.path.join(os.path.dirname(__file__), "memory_store.jsonl")
+COMPACT_EVERY_SEC = 60.0
+COMPACT_EVERY_EVENTS = 1000
+MAX_EVENTS_PER_SESSION = 20
+MAX_HOT_SESSIONS = int(os.getenv("MAX_HOT_SESSIONS", "10000"))
 
-_sessions: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+Events = List[Dict[str, Any]]
 
 
-def _load_from_disk() -> None:
-    if not os.path.exists(MEMORY_PATH):
-        return
+class SessionStore:
+    """
+    LRU of the sessions held in RAM. Evicted sessions are only dropped from
+    memory — the snapshot/WAL on disk stays the source of truth, and they
+    are paged back in on next use.
+    """
+
+    def __init__(self, maxsize: int = MAX_HOT_SESSIONS):
+        self.maxsize = maxsize
+        self._lru: "OrderedDict[str, Events]" = OrderedDict()
+
+    def get(self, sid: str) -> Optional[Events]:
+        events = self._lru.get(sid)
+        if events is not None:
+            self._lru.move_to_end(sid)
+        return events
+
+    def put(self, sid: str, events: Events) -> None:
+        self._lru[sid] = events
+        self._lru.move_to_end(sid)
+        while len(self._lru) > self.maxsize:
+            evicted, _ = self._lru.popitem(last=False)
+            _summary_cache.pop(evicted, None)
+            inc_metric("sessions_evicted")
+        set_metric("sessions_hot", len(self._lru))
+
+    def __contains__(self, sid: str) -> bool:
+        return sid in self._lru
+
+
+_sessions = SessionStore()
+# Every session id on disk or in RAM, so unknown ids never touch the disk.
+_known: Set[str] = set()
+# session id -> summarize_history() output; dropped whenever events change.
+_summary_cache: Dict[str, str] = {}
+
+set_metric("sessions_hot_ceiling", MAX_HOT_SESSIONS)
+
+# One thread, so WAL appends, compactions and page-ins hit the disk in
+# submit order: a page-in always sees every append queued before it.
+_io_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="memory-io")
+_pending_events = 0
+_last_compact = time.monotonic()
+
+
+def _apply(store: Dict[str, Events], sid: str, event: Dict[str, Any] | None) -> None:
+    events = store.setdefault(sid, [])
+    if event is not None:
+        events.append(event)
+        if len(events) > MAX_EVENTS_PER_SESSION:
+            store[sid] = events[-MAX_EVENTS_PER_SESSION:]
+
+
+def _records(lines: Iterator[bytes], needle: Optional[bytes]) -> Iterator[Dict[str, Any]]:
+    """
+    Parsed JSON lines. With `needle`, lines that don't contain it are
+    skipped before parsing, so a single-session read stays a byte scan.
+    """
+    for line in lines:
+        if needle is not None and needle not in line:
+            continue
+        try:
+            yield orjson.loads(line)
+        except ValueError:
+            continue  # torn last line after a crash
+
+
+def _is_snapshot_record(rec: Any) -> bool:
+    return isinstance(rec, dict) and isinstance(rec.get("sid"), str)
+
+
+def _read_snapshot(only: Optional[str], needle: Optional[bytes]) -> Dict[str, Events]:
+    """
+    Sessions in the snapshot (all, or just `only`). Raises ValueError if
+    the file exists but can't be parsed, so compaction never overwrites it.
+    """
     try:
-        with open(MEMORY_PATH, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        for sid, events in data.items():
-            _sessions[sid] = list(events)
-    except Exception:
+        f = open(MEMORY_PATH, "rb")
+    except OSError:
+        return {}
+    with f:
+        first = f.readline()
+        while first and not first.strip():
+            first = f.readline()
+        if not first:
+            return {}
+        try:
+            head = orjson.loads(first)
+        except ValueError:
+            head = None
+
+        if not _is_snapshot_record(head):
+            # Pre-JSONL snapshot: one (possibly pretty-printed) object
+            # mapping every sid to its events. Parsed whole, once.
+            f.seek(0)
+            legacy = orjson.loads(f.read())
+            if not isinstance(legacy, dict):
+                raise ValueError("memory snapshot is not a JSON object")
+            return {
+                sid: list(ev)
+                for sid, ev in legacy.items()
+                if only is None or sid == only
+            }
+
+        store: Dict[str, Events] = {}
+        for rec in _records(itertools.chain([first], f), needle):
+            if _is_snapshot_record(rec) and (only is None or rec["sid"] == only):
+                store[rec["sid"]] = list(rec.get("evs") or [])
+        return store
+
+
+def _read_store(only: Optional[str] = None, strict: bool = False) -> Dict[str, Events]:
+    """
+    Snapshot with the WAL replayed on top: the full on-disk state, or just
+    session `only` when given. An unreadable snapshot is logged and treated
+    as empty unless `strict`, in which case the error propagates.
+    """
+    needle = orjson.dumps(only) if only is not None else None
+    try:
+        store = _read_snapshot(only, needle)
+    except ValueError as e:
+        if strict:
+            raise
+        log.error("Memory snapshot %s unreadable: %s", MEMORY_PATH, e)
+        store = {}
+
+    try:
+        with open(WAL_PATH, "rb") as f:
+            for rec in _records(f, needle):
+                if only is None or rec["sid"] == only:
+                    _apply(store, rec["sid"], rec.get("ev"))
+    except OSError:
         pass
+    return store
+
+
+def _load_from_disk() -> None:
+    store = _read_store()
+    _known.update(store)
+    # Warm the LRU with the most recently written sessions.
+    for sid in list(store)[-MAX_HOT_SESSIONS:]:
+        _sessions.put(sid, store[sid])
 
 
-def _save_to_disk() -> None:
+def _append_line(line: bytes) -> None:
     try:
-        with open(MEMORY_PATH, "w", encoding="utf-8") as f:
-            json.dump({sid: ev for sid, ev in _sessions.items()}, f, ensure_ascii=False, indent=2)
+        fd = os.open(WAL_PATH, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
     except Exception:
         pass
 
 
-_load_from_disk()
+def _compact() -> None:
+    """Fold the WAL into the snapshot atomically, then truncate the WAL."""
+    try:
+        # strict: never replace a snapshot we failed to read with a partial one.
+        store = _read_store(strict=True)
+        tmp = MEMORY_PATH + ".tmp"
+        with open(tmp, "wb") as f:
+            for sid, events in store.items():
+                f.write(
+                    orjson.dumps(
+                        {"sid": sid, "evs": events}, option=orjson.OPT_APPEND_NEWLINE
+                    )
+                )
+        os.replace(tmp, MEMORY_PATH)
+        open(WAL_PATH, "w").close()
+    except Exception as e:
+        log.error("Memory compaction failed, keeping snapshot and WAL: %s", e)
+
+
+def _read_session(sid: str) -> Events:
+    return _read_store(only=sid).get(sid, [])
+
 
+async def _page_in(sid: str) -> Events:
+    """
+    Load an evicted session back from disk. Runs on the I/O thread, after
+    every WAL append queued before it, without blocking the event loop.
+    """
+    inc_metric("sessions_paged_in")
+    loop = asyncio.get_running_loop()
+    events = await loop.run_in_executor(_io_pool, _read_session, sid)
+    # Another request may have paged it in while we waited.
+    current = _sessions.get(sid)
+    if current is not None:
+        return current
+    _sessions.put(sid, events)
+    return events
 
-def get_or_create_session(session_id: str | None) -> str:
-    if session_id and session_id in _sessions:
+
+async def _get(sid: str) -> Optional[Events]:
+    events = _sessions.get(sid)
+    if events is None and sid in _known:
+        events = await _page_in(sid)
+    return events
+
+
+def _log(sid: str, event: Dict[str, Any] | None = None) -> None:
+    """Queue one WAL record; compact once enough time or events have piled up."""
+    global _pending_events, _last_compact
+    rec: Dict[str, Any] = {"sid": sid}
+    if event is not None:
+        rec["ev"] = event
+    _io_pool.submit(_append_line, orjson.dumps(rec, option=orjson.OPT_APPEND_NEWLINE))
+
+    _pending_events += 1
+    now = time.monotonic()
+    if (
+        _pending_events >= COMPACT_EVERY_EVENTS
+        or now - _last_compact >= COMPACT_EVERY_SEC
+    ):
+        flush()
+        _last_compact = now
+
+
+def flush() -> None:
+    """
+    Queue a compaction. It runs after every WAL line queued before it, so
+    nothing is lost when the WAL is truncated.
+    """
+    global _pending_events
+    _pending_events = 0
+    _io_pool.submit(_compact)
+
+
+def shutdown() -> None:
+    flush()
+    _io_pool.shutdown(wait=True)
+
+
+if get_redis() is None:
+    _load_from_disk()
+
+
+# --- Redis-backed sessions (REDIS_URL set: shared by all workers) ---
+# session:{sid} marks the session as existing; session:{sid}:events is a
+# list capped at MAX_EVENTS_PER_SESSION with RPUSH + LTRIM.
+
+def _events_key(sid: str) -> str:
+    return f"session:{sid}:events"
+
+
+async def _redis_get_or_create(r: Any, session_id: str | None) -> str:
+    if session_id and await r.exists(f"session:{session_id}"):
         return session_id
     new_id = str(uuid.uuid4())
-    _sessions[new_id] = []
-    _save_to_disk()
+    await r.set(f"session:{new_id}", 1)
     return new_id
 
 
-def append_event(session_id: str, event: Dict[str, Any]):
-    _sessions[session_id].append(event)
-    if len(_sessions[session_id]) > 20:
-        _sessions[session_id] = _sessions[session_id][-20:]
-    _save_to_disk()
+async def _redis_append(r: Any, session_id: str, event: Dict[str, Any]) -> None:
+    async with r.pipeline(transaction=True) as pipe:
+        pipe.set(f"session:{session_id}", 1)
+        pipe.rpush(_events_key(session_id), orjson.dumps(event, default=str))
+        pipe.ltrim(_events_key(session_id), -MAX_EVENTS_PER_SESSION, -1)
+        await pipe.execute()
 
 
-def summarize_history(session_id: str) -> str:
-    items = _sessions.get(session_id, [])
-    if not items:
-        return ""
+async def _redis_events(r: Any, session_id: str, last: int) -> Events:
+    raw = await r.lrange(_events_key(session_id), -last, -1)
+    return [orjson.loads(ev) for ev in raw]
+
+
+# --- Public API ---
+
+def _format_history(items: Events) -> str:
     lines = []
     for ev in items[-8:]:
         score = ev.get("score")
         title = ev.get("title") or ""
         summary = ev.get("summary") or ""
         lines.append(f"[score={score}] {title} :: {summary}")
-    full = " | ".join(lines)
-    return full[-2000:]
+    return " | ".join(lines)[-2000:]
+
+
+async def get_or_create_session(session_id: str | None) -> str:
+    r = get_redis()
+    if r is not None:
+        return await _redis_get_or_create(r, session_id)
+
+    if session_id and await _get(session_id) is not None:
+        return session_id
+    new_id = str(uuid.uuid4())
+    _known.add(new_id)
+    _sessions.put(new_id, [])
+    _log(new_id)
+    return new_id
+
+
+async def append_event(session_id: str, event: Dict[str, Any]):
+    r = get_redis()
+    if r is not None:
+        await _redis_append(r, session_id, event)
+        return
+
+    events = await _get(session_id)
+    if events is None:
+        _known.add(session_id)
+        events = []
+    events.append(event)
+    _sessions.put(session_id, events[-MAX_EVENTS_PER_SESSION:])
+    _summary_cache.pop(session_id, None)
+    _log(session_id, event)
+
+
+async def summarize_history(session_id: str) -> str:
+    r = get_redis()
+    if r is not None:
+        return _format_history(await _redis_events(r, session_id, 8))
+
+    cached = _summary_cache.get(session_id)
+    if cached is not None:
+        return cached
+    items = await _get(session_id) or []
+    if not items:
+        return ""
+    full = _format_history(items)
+    _summary_cache[session_id] = full
+    return full
 
 
-def get_session_history(session_id: str) -> List[Dict[str, Any]]:
-    return list(_sessions.get(session_id, []))
+async def get_session_history(session_id: str) -> List[Dict[str, Any]]:
+    r = get_redis()
+    if r is not None:
+        return await _redis_events(r, session_id, MAX_EVENTS_PER_SESSION)
+    return list(await _get(session_id) or [])
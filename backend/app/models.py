@@ -1,6 +1,6 @@
 # backend/app/models.py
 
-from typing import List, Optional, Dict, Any
+from typing import List, Optional
 from pydantic import BaseModel
 
 
@@ -0,0 +1,31 @@
+# backend/app/redis_client.py
+
+import os
+from typing import Any, Optional
+
+# Set REDIS_URL to share jobs and sessions between uvicorn workers; without
+# it, both stay in process (fine for a single worker).
+REDIS_URL = os.getenv("REDIS_URL")
+
+_redis: Optional[Any] = None
+
+
+def get_redis() -> Optional[Any]:
+    """Shared redis.asyncio client, or None when REDIS_URL is not set."""
+    global _redis
+    if not REDIS_URL:
+        return None
+    if _redis is None:
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError("REDIS_URL is set but the 'redis' package is not installed.") from e
+        _redis = redis.Redis(connection_pool=redis.ConnectionPool.from_url(REDIS_URL))
+    return _redis
+
+
+async def close_redis() -> None:
+    global _redis
+    if _redis is not None:
+        await _redis.aclose()
+        _redis = None
@@ -0,0 +1,109 @@
+# backend/app/response_cache.py
+
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import orjson
+from PIL import Image
+
+RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH") or os.path.join(
+    os.path.dirname(__file__), ".gemini_cache", "responses.sqlite3"
+)
+RESPONSE_CACHE_TTL_SEC = float(os.getenv("RESPONSE_CACHE_TTL_SEC", str(24 * 3600)))
+# Max differing bits between two 64-bit dHashes to count as "the same" thumbnail.
+MAX_HAMMING = 6
+
+_WS_RE = re.compile(r"\s+")
+
+_conn: Optional[sqlite3.Connection] = None
+_lock = threading.Lock()
+
+
+def _db() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        os.makedirs(os.path.dirname(RESPONSE_CACHE_PATH), exist_ok=True)
+        _conn = sqlite3.connect(RESPONSE_CACHE_PATH, check_same_thread=False)
+        _conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " session_id TEXT NOT NULL,"
+            " text_key TEXT NOT NULL,"
+            " phash TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " result BLOB NOT NULL)"
+        )
+        _conn.execute(
+            "CREATE INDEX IF NOT EXISTS responses_lookup"
+            " ON responses (session_id, text_key, created_at)"
+        )
+    return _conn
+
+
+def image_dhash(img: Image.Image) -> int:
+    """
+    64-bit difference hash: survives re-encodes, resizes and small edits,
+    so a lightly tweaked re-upload lands within MAX_HAMMING of the original.
+    """
+    small = img.resize((9, 8), Image.BILINEAR, reducing_gap=2.0).convert("L")
+    px = list(small.getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            i = row * 9 + col
+            bits = (bits << 1) | (px[i] > px[i + 1])
+    return bits
+
+
+def _text_key(title: str, description: str, mode: str) -> str:
+    # Quick and deep runs use different Gemini budgets; never mix them.
+    text = _WS_RE.sub(" ", f"{title}\n{description}").strip().lower()
+    return f"{mode}:{text}"
+
+
+def lookup(
+    session_id: str, img: Image.Image, title: str, description: str, mode: str
+) -> Optional[Dict[str, Any]]:
+    """Return a fresh cached analysis for a near-identical image + same text and mode."""
+    phash = image_dhash(img)
+    cutoff = time.time() - RESPONSE_CACHE_TTL_SEC
+    with _lock:
+        rows = _db().execute(
+            "SELECT phash, result FROM responses"
+            " WHERE session_id = ? AND text_key = ? AND created_at >= ?"
+            " ORDER BY created_at DESC",
+            (session_id, _text_key(title, description, mode), cutoff),
+        ).fetchall()
+    for hex_hash, result in rows:
+        if bin(phash ^ int(hex_hash, 16)).count("1") <= MAX_HAMMING:
+            return orjson.loads(result)
+    return None
+
+
+def store(
+    session_id: str,
+    img: Image.Image,
+    title: str,
+    description: str,
+    mode: str,
+    result: Dict[str, Any],
+) -> None:
+    now = time.time()
+    row = (
+        session_id,
+        _text_key(title, description, mode),
+        f"{image_dhash(img):016x}",
+        now,
+        orjson.dumps(result, default=str),
+    )
+    with _lock:
+        db = _db()
+        db.execute(
+            "DELETE FROM responses WHERE created_at < ?",
+            (now - RESPONSE_CACHE_TTL_SEC,),
+        )
+        db.execute("INSERT INTO responses VALUES (?, ?, ?, ?, ?)", row)
+        db.commit()
@@ -1,10 +1,11 @@
 # backend/app/scoring.py
 
 import io
+import logging
 import os
 from typing import Any, Dict, List, Tuple
 
-from PIL import Image, ImageStat
+from PIL import Image
 
 # Gemini integration (same import as your project)
 try:
@@ -12,6 +13,10 @@ try:
 except Exception:
     call_gemini_image_analysis = None  # type: ignore
 
+from .imaging import channel_stats, to_rgb
+
+log = logging.getLogger("thumbnail-agent")
+
 # Only call Gemini if this flag is set AND ai_gemini imported
 USE_GEMINI = os.environ.get("USE_GEMINI_THUMB", "0") == "1"
 
@@ -19,11 +24,9 @@ USE_GEMINI = os.environ.get("USE_GEMINI_THUMB", "0") == "1"
 # ---------- Image + heuristics (UI only) ----------
 
 def _open_image(image_bytes: bytes) -> Image.Image:
-    """Decode raw bytes into a PIL Image."""
+    """Decode raw bytes into an RGB PIL Image."""
     try:
-        img = Image.open(io.BytesIO(image_bytes))
-        img = img.convert("RGB")
-        return img
+        return to_rgb(Image.open(io.BytesIO(image_bytes)))
     except Exception as e:
         raise ValueError(f"Could not decode image: {e}")
 
@@ -36,15 +39,15 @@ def _basic_heuristics(img: Image.Image) -> Dict[str, float]:
     only for quick visual metrics.
     """
     w, h = img.size
-    stat = ImageStat.Stat(img)
+    means, stds = channel_stats(img)
 
     # brightness 0–255 -> 0–10
-    r_mean, g_mean, b_mean = stat.mean
+    r_mean, g_mean, b_mean = means
     brightness = (r_mean + g_mean + b_mean) / 3.0
     brightness_score = max(0.0, min(10.0, (brightness / 255.0) * 10.0))
 
     # contrast: stddev -> rough 0–10 scaling
-    r_std, g_std, b_std = stat.stddev
+    r_std, g_std, b_std = stds
     contrast_raw = (r_std + g_std + b_std) / 3.0
     contrast_score = max(0.0, min(10.0, (contrast_raw / 80.0) * 10.0))
 
@@ -352,7 +355,7 @@ def rate_thumbnail(
             gem_scores = _extract_gemini_scores(gemini_result or {})
             gemini_used = True
         except Exception as e:
-            print("Gemini error in rate_thumbnail:", e)
+            log.error("Gemini error in rate_thumbnail: %s", e)
             gemini_result = {"error": str(e)}
             gemini_used = False
 
@@ -0,0 +1,46 @@
+# backend/app/workers.py
+
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", str(os.cpu_count() or 1)))
+
+_cpu_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_cpu_pool() -> ProcessPoolExecutor:
+    """
+    Shared process pool for CPU-bound image work (PIL decode, pixel stats).
+
+    Created lazily rather than at import: worker processes re-import the
+    agent modules, and an import-time pool would spawn pools of its own.
+    """
+    global _cpu_pool
+    if _cpu_pool is None:
+        _cpu_pool = ProcessPoolExecutor(max_workers=CPU_WORKERS)
+    return _cpu_pool
+
+
+def _noop() -> None:
+    return None
+
+
+async def start_cpu_pool() -> ProcessPoolExecutor:
+    """
+    Create the pool at app startup and spawn all its workers up front, so
+    the first uploads don't pay process start-up inside their request.
+    """
+    pool = get_cpu_pool()
+    await asyncio.gather(
+        *(asyncio.wrap_future(pool.submit(_noop)) for _ in range(CPU_WORKERS))
+    )
+    return pool
+
+
+def shutdown_cpu_pool() -> None:
+    global _cpu_pool
+    if _cpu_pool is not None:
+        _cpu_pool.shutdown(wait=False, cancel_futures=True)
+        _cpu_pool = None
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The backend is run from backend/ (uvicorn app.main:app); mirror that here.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
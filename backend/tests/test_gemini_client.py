@@ -0,0 +1,25 @@
+import os
+
+os.environ.setdefault("GEMINI_API_KEY", "test-key")
+
+from app.gemini_client import extract_json  # noqa: E402
+
+
+def test_extract_json_plain_object():
+    assert extract_json('{"score": 7}') == {"score": 7}
+
+
+def test_extract_json_with_trailing_text():
+    text = '{"score": 7, "tips": ["crop"]}\nLet me know if you need more.'
+    assert extract_json(text) == {"score": 7, "tips": ["crop"]}
+
+
+def test_extract_json_in_code_fence():
+    text = 'Here you go:\n```json\n{"score": 7}\n```'
+    assert extract_json(text) == {"score": 7}
+
+
+def test_extract_json_rejects_truncated_and_non_objects():
+    assert extract_json('{"score": 7, "tips": [') == {}
+    assert extract_json("[1, 2]") == {}
+    assert extract_json("") == {}
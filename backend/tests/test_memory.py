@@ -0,0 +1,49 @@
+import os
+import shutil
+
+import orjson
+
+from app.memory import memory
+
+LEGACY_SNAPSHOT = os.path.join(os.path.dirname(memory.__file__), "memory_store.json")
+
+
+def _use_copy_of_legacy_snapshot(tmp_path, monkeypatch):
+    path = tmp_path / "memory_store.json"
+    shutil.copyfile(LEGACY_SNAPSHOT, path)
+    monkeypatch.setattr(memory, "MEMORY_PATH", str(path))
+    monkeypatch.setattr(memory, "WAL_PATH", str(tmp_path / "memory_store.jsonl"))
+    with open(LEGACY_SNAPSHOT, "rb") as f:
+        return path, orjson.loads(f.read())
+
+
+def test_reads_pretty_printed_legacy_snapshot(tmp_path, monkeypatch):
+    _, legacy = _use_copy_of_legacy_snapshot(tmp_path, monkeypatch)
+    assert legacy
+
+    assert memory._read_store() == legacy
+    sid, events = next(iter(legacy.items()))
+    assert memory._read_session(sid) == events
+    assert memory._read_session("no-such-session") == []
+
+
+def test_compact_preserves_legacy_sessions(tmp_path, monkeypatch):
+    path, legacy = _use_copy_of_legacy_snapshot(tmp_path, monkeypatch)
+
+    memory._compact()
+
+    with open(path, "rb") as f:
+        records = [orjson.loads(line) for line in f if line.strip()]
+    assert {r["sid"]: r["evs"] for r in records} == legacy
+    assert memory._read_store() == legacy
+
+
+def test_compact_keeps_unreadable_snapshot(tmp_path, monkeypatch):
+    path = tmp_path / "memory_store.json"
+    path.write_bytes(b"{ not json")
+    monkeypatch.setattr(memory, "MEMORY_PATH", str(path))
+    monkeypatch.setattr(memory, "WAL_PATH", str(tmp_path / "memory_store.jsonl"))
+
+    memory._compact()
+
+    assert path.read_bytes() == b"{ not json"
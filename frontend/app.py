@@ -1,16 +1,24 @@
-import requests
+import io
 import os
 import re
 from pathlib import Path
 import streamlit as st
-import runpy
-import streamlit as st
+
+# requests, requests_toolbelt and PIL are imported where they're used, so
+# the API-key gate (which st.stop()s early) doesn't pay for loading them.
 
 API_BASE = "http://127.0.0.1:8000"
 API_ANALYZE = f"{API_BASE}/api/v1/thumbnail/analyze"
 
 PAGE_TITLE = "Thumbnail Reviewer · Gemini Agent"
 
+# Heuristic metric keys from the backend -> display labels, in display order.
+METRIC_LABELS = (
+    ("brightness", "Brightness"),
+    ("contrast", "Contrast"),
+    ("aspect_ratio_fit", "Aspect fit"),
+)
+
 # paths
 HERE = Path(__file__).resolve().parent
 ENV_PATH = HERE.parent / ".env"
@@ -20,6 +28,8 @@ ENV_EXAMPLE_PATH = PROJECT_ROOT / ".env.example"
 
 GEMINI_KEY_NAME = "GEMINI_API_KEY"
 PLACEHOLDER_VALUES = {"", "your_key_here", "YOUR_KEY_HERE", "your_key", "replace_me"}
+_KEY_LINE_RE = re.compile(rf"^{GEMINI_KEY_NAME}\s*=.*$", re.MULTILINE)
+_KEY_RE = re.compile(rf"^[ \t]*{GEMINI_KEY_NAME}[ \t]*=[ \t]*(.*?)[ \t\r]*$", re.MULTILINE)
 
 def read_text(path: Path):
     try:
@@ -33,11 +43,8 @@ def write_text(path: Path, txt: str):
 def extract_key(contents: str | None):
     if not contents:
         return None
-    for line in contents.splitlines():
-        line = line.strip()
-        if line.startswith(f"{GEMINI_KEY_NAME}="):
-            return line.split("=", 1)[1].strip()
-    return None
+    m = _KEY_RE.search(contents)
+    return m.group(1) if m else None
 
 def save_env_from_example(user_key: str):
     if not ENV_EXAMPLE_PATH.exists():
@@ -47,27 +54,132 @@ def save_env_from_example(user_key: str):
     if example_text is None:
         raise RuntimeError(".env.example unreadable")
 
-    # remove old .env if present
-    if ENV_PATH.exists():
-        try:
-            ENV_PATH.unlink()
-        except Exception:
-            # ignore unlink errors and try to overwrite by write_text
-            pass
-
-    pattern = re.compile(rf"^{GEMINI_KEY_NAME}\s*=.*$", flags=re.MULTILINE)
     new_line = f"{GEMINI_KEY_NAME}={user_key}"
 
-    if pattern.search(example_text):
-        new_contents = pattern.sub(new_line, example_text)
-    else:
-        new_contents = example_text + ("\n" if not example_text.endswith("\n") else "") + new_line + "\n"
-
-    write_text(ENV_PATH, new_contents)
+    # subn both finds and replaces; the callable keeps backslashes in the
+    # key from being read as group references.
+    new_contents, replaced = _KEY_LINE_RE.subn(lambda _: new_line, example_text)
+    if not replaced:
+        sep = "" if example_text.endswith("\n") else "\n"
+        new_contents = f"{example_text}{sep}{new_line}\n"
+
+    # Write beside .env, then rename over it: readers see either the old
+    # file or the new one, never a missing or half-written .env.
+    tmp_path = ENV_PATH.with_name(ENV_PATH.name + ".tmp")
+    write_text(tmp_path, new_contents)
+    os.replace(tmp_path, ENV_PATH)
+
+# Streamed uploads go out in 1 MiB socket writes (http.client's default
+# is 8 KiB); anything under SMALL_UPLOAD_BYTES is just sent as one buffer.
+UPLOAD_BLOCK_SIZE = 1024 * 1024
+SMALL_UPLOAD_BYTES = 256 * 1024
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def _load_env_key(mtime: float) -> str | None:
+    # mtime is the cache key: reruns cost one stat() until .env changes.
+    return extract_key(read_text(ENV_PATH))
+
+def _env_mtime() -> float:
+    try:
+        return ENV_PATH.stat().st_mtime
+    except OSError:
+        return 0.0
+
+@st.cache_resource
+def _css() -> str:
+    # Read once per server process; reruns only re-send the cached string.
+    return f"<style>{(HERE / 'static' / 'app.css').read_text(encoding='utf-8')}</style>"
+
+@st.cache_resource
+def _session():
+    # One pooled session for the app's lifetime, so reruns reuse the
+    # keep-alive connection to the backend.
+    import requests
+    import urllib3
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    class _UploadAdapter(HTTPAdapter):
+        def init_poolmanager(self, *args, **kwargs):
+            # Connection(blocksize=...) is urllib3 2.x only; on 1.26 an
+            # unknown pool kwarg would break every request.
+            if not urllib3.__version__.startswith("1."):
+                kwargs["blocksize"] = UPLOAD_BLOCK_SIZE
+            super().init_poolmanager(*args, **kwargs)
+
+    s = requests.Session()
+    s.mount(
+        "http://",
+        _UploadAdapter(
+            pool_connections=4,
+            pool_maxsize=4,
+            # POST is not retried by default; only connection errors are,
+            # which never reached the backend.
+            max_retries=Retry(total=2, backoff_factor=0.2),
+        ),
+    )
+    return s
+
+PREVIEW_SIZE = (960, 540)
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def _preview_jpeg(raw: bytes) -> bytes:
+    # Keyed on the upload bytes, so widget edits rerun the script without
+    # re-decoding the same thumbnail. Returns display-size JPEG bytes, which
+    # st.image sends as-is instead of re-encoding a full-size PNG.
+    from PIL import Image
+
+    img = Image.open(io.BytesIO(raw))
+    # JPEG: let libjpeg decode straight at (roughly) preview scale.
+    img.draft("RGB", PREVIEW_SIZE)
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    img.thumbnail(PREVIEW_SIZE, Image.Resampling.BILINEAR)
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", quality=82, progressive=True)
+    return buf.getvalue()
+
+UPLOAD_SIZE = (1280, 720)
+RESIZE_UPLOAD_OVER_BYTES = 512_000
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def _upload_jpeg(raw: bytes) -> bytes:
+    # YouTube-size JPEG of the upload; cached so re-analyzing the same file
+    # doesn't re-encode it.
+    from PIL import Image
+
+    img = Image.open(io.BytesIO(raw))
+    img.draft("RGB", UPLOAD_SIZE)
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    img.thumbnail(UPLOAD_SIZE, Image.Resampling.LANCZOS)
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", quality=85, progressive=True)
+    return buf.getvalue()
+
+def _bullet_block(heading: str, items) -> str:
+    # One markdown element per section instead of one st.write per bullet.
+    bullets = "\n".join(f"- {item}" for item in items)
+    return f"{heading}\n\n{bullets}" if heading else bullets
+
+def _review_lines(review):
+    # Backend returns a structured dict; older backends sent a list of lines.
+    if not isinstance(review, dict):
+        return review or []
+    lines = [review.get("top_line", "")]
+    if review.get("ai_perspective"):
+        lines.append(f"AI perspective: {review['ai_perspective']}")
+    if review.get("strengths"):
+        lines.append("Strengths: " + "; ".join(review["strengths"]) + ".")
+    if review.get("improvements"):
+        lines.append("Improvements: " + "; ".join(review["improvements"]) + ".")
+    eng = review.get("engagement")
+    if eng:
+        lines.append(f"Engagement outlook {eng.get('score')}/10 – {eng.get('text', '')}")
+    return [line for line in lines if line]
 
 # ---------- startup check ----------
-env_contents = read_text(ENV_PATH)
-current_key = extract_key(env_contents)
+current_key = _load_env_key(_env_mtime())
 needs_key = current_key is None or current_key in PLACEHOLDER_VALUES
 
 if needs_key:
@@ -116,8 +228,7 @@ if needs_key:
     with c2:
         if st.button("I already have .env (re-check)"):
             # re-check .env in case user created it externally
-            env_contents = read_text(ENV_PATH)
-            current_key = extract_key(env_contents)
+            current_key = _load_env_key(_env_mtime())
             if current_key and current_key not in PLACEHOLDER_VALUES:
                 os.environ[GEMINI_KEY_NAME] = current_key
                 st.success("Found valid key in .env. Reloading app.")
@@ -132,9 +243,7 @@ if needs_key:
     st.stop()
 
 # If key exists, load into environment for downstream code
-existing_key = extract_key(read_text(ENV_PATH))
-if existing_key:
-    os.environ[GEMINI_KEY_NAME] = existing_key
+os.environ[GEMINI_KEY_NAME] = current_key
 
 st.set_page_config(
     page_title=PAGE_TITLE,
@@ -143,221 +252,7 @@ st.set_page_config(
 )
 
 # ---------- STYLING ----------
-st.markdown(
-    """
-    <style>
-    @import url('https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700&display=swap');
-
-    * {
-        font-family: 'Inter', system-ui, -apple-system, BlinkMacSystemFont, "Segoe UI", sans-serif;
-    }
-
-    [data-testid="stAppViewContainer"] {
-        background:
-            radial-gradient(circle at top left, #1f2937 0, transparent 55%),
-            radial-gradient(circle at bottom right, #020617 0, transparent 60%),
-            #020617;
-        color: #e5e7eb;
-    }
-
-    [data-testid="stSidebar"] {
-        background: #020617;
-    }
-
-    .app-shell {
-        padding: 1.8rem 2.1rem 2.4rem;
-        max-width: 1240px;
-        margin: 0 auto;
-    }
-
-    .section-label {
-        font-size: 0.78rem;
-        text-transform: uppercase;
-        color: #6b7280;
-        margin-bottom: 0.55rem;
-        letter-spacing: 0.12em;
-    }
-
-    .card {
-        background: rgba(15,23,42,0.96);
-        border-radius: 1.15rem;
-        padding: 1.2rem 1.25rem 1.3rem;
-        border: 1px solid rgba(148,163,184,0.25);
-        box-shadow: 0 18px 40px rgba(0,0,0,0.45);
-        backdrop-filter: blur(16px);
-        animation: floatIn 0.45s ease-out;
-    }
-
-    .card-soft {
-        background: rgba(15,23,42,0.9);
-        border-radius: 0.9rem;
-        padding: 0.75rem 0.9rem;
-        border: 1px solid rgba(148,163,184,0.2);
-    }
-
-    .pill {
-        font-size: 0.7rem;
-        padding: 0.2rem 0.65rem;
-        border-radius: 999px;
-        background: rgba(15,23,42,0.95);
-        border: 1px solid rgba(148,163,184,0.4);
-        color: #9ca3af;
-        display: inline-flex;
-        align-items: center;
-        gap: 0.25rem;
-    }
-
-    .pill-dot {
-        width: 0.38rem;
-        height: 0.38rem;
-        border-radius: 999px;
-        background: #22c55e;
-        display: inline-block;
-    }
-
-    .score-badge {
-        display: inline-flex;
-        align-items: baseline;
-        gap: 0.2rem;
-        padding: 0.20rem 0.9rem 0.22rem 0.8rem;
-        background: linear-gradient(135deg, #22c55e, #4ade80);
-        border-radius: 999px;
-        color: #022c22;
-        box-shadow: 0 14px 30px rgba(34,197,94,0.35);
-        transform-origin: left center;
-        animation: scorePop 0.45s ease-out;
-    }
-
-    .score-badge .value {
-        font-size: 1.6rem;
-        font-weight: 700;
-    }
-
-    .score-badge .unit {
-        font-size: 0.8rem;
-        font-weight: 600;
-        opacity: 0.85;
-    }
-
-    .review-heading {
-        font-size: 0.9rem;
-        font-weight: 600;
-        margin: 1rem 0 0.45rem;
-    }
-
-    .review-item {
-        font-size: 0.82rem;
-        color: #d1d5db;
-        padding: 0.35rem 0.5rem;
-        border-radius: 0.7rem;
-        background: linear-gradient(90deg, rgba(15,23,42,0.9), rgba(15,23,42,0.4));
-        border: 1px solid rgba(31,41,55,0.75);
-        margin-bottom: 0.28rem;
-    }
-
-    .review-item .index {
-        opacity: 0.7;
-        margin-right: 0.25rem;
-    }
-
-    .powered-note {
-        font-size: 0.75rem;
-        color: #6b7280;
-        margin-top: 0.6rem;
-    }
-
-    /* Button styling */
-    div.stButton > button {
-        border-radius: 999px;
-        padding: 0.4rem 1.4rem;
-        border: 1px solid rgba(56,189,248,0.6);
-        background: radial-gradient(circle at top left, #38bdf8, #0ea5e9);
-        color: #0b1220;
-        font-weight: 600;
-        font-size: 0.86rem;
-        box-shadow: 0 14px 30px rgba(8,47,73,0.7);
-        transition: transform 0.12s ease-out, box-shadow 0.12s ease-out, filter 0.12s ease-out;
-    }
-
-    div.stButton > button:hover {
-        transform: translateY(-1px) scale(1.01);
-        box-shadow: 0 18px 40px rgba(8,47,73,0.9);
-        filter: brightness(1.05);
-    }
-
-    div.stButton > button:active {
-        transform: translateY(0) scale(0.99);
-        box-shadow: 0 10px 22px rgba(8,47,73,0.7);
-    }
-
-    /* Alert (success / error) */
-    [data-testid="stAlert"] {
-        border-radius: 0.9rem;
-        border-width: 1px;
-    }
-
-    /* Expander tweaks */
-    [data-testid="stExpander"] {
-        border-radius: 0.9rem;
-        border: 1px solid rgba(55,65,81,0.9);
-        background: rgba(15,23,42,0.92);
-    }
-
-    [data-testid="stExpander"] > details > summary {
-        padding-top: 0.5rem;
-        padding-bottom: 0.5rem;
-    }
-
-    /* Inputs */
-    .stTextInput > div > div > input,
-    .stTextArea textarea {
-        border-radius: 0.6rem;
-        border: 1px solid rgba(55,65,81,0.9);
-        background: rgba(15,23,42,0.9);
-        color: #e5e7eb;
-    }
-
-    .stTextInput > div > div > input:focus,
-    .stTextArea textarea:focus {
-        border-color: rgba(56,189,248,0.9);
-        box-shadow: 0 0 0 1px rgba(56,189,248,0.6);
-    }
-
-    /* Radio spacing */
-    div[role="radiogroup"] > label {
-        padding: 0.12rem 0;
-        font-size: 0.82rem;
-    }
-
-    /* Keyframes */
-    @keyframes floatIn {
-        from {
-            transform: translateY(8px) scale(0.98);
-            opacity: 0;
-        }
-        to {
-            transform: translateY(0) scale(1);
-            opacity: 1;
-        }
-    }
-
-    @keyframes scorePop {
-        0% {
-            transform: scale(0.7);
-            opacity: 0;
-        }
-        60% {
-            transform: scale(1.05);
-            opacity: 1;
-        }
-        100% {
-            transform: scale(1.0);
-        }
-    }
-    </style>
-    """,
-    unsafe_allow_html=True,
-)
+st.markdown(_css(), unsafe_allow_html=True)
 
 st.markdown('<div class="app-shell">', unsafe_allow_html=True)
 
@@ -421,7 +316,12 @@ with left:
     )
 
     if uploaded:
-        st.image(uploaded, caption="Preview", use_container_width=True)
+        # Copy the upload out once per file, not on every rerun.
+        if st.session_state.get("upload_id") != uploaded.file_id:
+            st.session_state.upload_bytes = uploaded.getvalue()
+            st.session_state.upload_preview = _preview_jpeg(st.session_state.upload_bytes)
+            st.session_state.upload_id = uploaded.file_id
+        st.image(st.session_state.upload_preview, caption="Preview", use_container_width=True)
 
     title_input = st.text_input("Video title (optional)")
     desc_input = st.text_area("Description (optional)", height=80)
@@ -440,6 +340,12 @@ with left:
         "Quick is usually enough. Use Deep when you want Gemini to think harder about composition, story and redesign ideas."
     )
 
+    keep_original = st.checkbox(
+        "Use original resolution",
+        value=False,
+        help="By default, large uploads are shrunk to 1280×720 before sending in Quick mode.",
+    )
+
     st.write("")
     analyze_clicked = st.button("Analyze thumbnail")
 
@@ -447,25 +353,60 @@ with left:
         if uploaded is None:
             st.warning("Upload a thumbnail first.")
         else:
-            files = {"file": (uploaded.name, uploaded.getvalue(), uploaded.type)}
-            data = {
+            import orjson
+            import requests
+            from requests_toolbelt import MultipartEncoder
+
+            upload_name, upload_bytes, upload_type = (
+                uploaded.name,
+                st.session_state.upload_bytes,
+                uploaded.type,
+            )
+            # The backend scores at YouTube size; shrink big uploads here so
+            # we don't ship megabytes it will throw away. Deep mode and the
+            # checkbox keep the original.
+            if (
+                not keep_original
+                and mode_key == "quick"
+                and len(upload_bytes) > RESIZE_UPLOAD_OVER_BYTES
+            ):
+                upload_bytes = _upload_jpeg(upload_bytes)
+                upload_name = f"{Path(upload_name).stem}.jpg"
+                upload_type = "image/jpeg"
+            fields = {
                 "title": title_input,
                 "description": desc_input,
                 "session_id": st.session_state.session_id,
                 "mode": mode_key,
             }
+            if len(upload_bytes) < SMALL_UPLOAD_BYTES:
+                post_kwargs = {
+                    "files": {"file": (upload_name, upload_bytes, upload_type)},
+                    "data": fields,
+                }
+            else:
+                # Stream the upload into the request body instead of
+                # assembling the whole multipart payload in memory first.
+                body = MultipartEncoder(
+                    fields={"file": (upload_name, upload_bytes, upload_type), **fields}
+                )
+                post_kwargs = {
+                    "data": body,
+                    "headers": {"Content-Type": body.content_type},
+                }
             timeout = 60 if mode_key == "quick" else 120
 
             try:
                 with st.spinner("Running multi-agent analysis with Gemini…"):
-                    r = requests.post(API_ANALYZE, files=files, data=data, timeout=timeout)
+                    r = _session().post(API_ANALYZE, timeout=timeout, **post_kwargs)
             except requests.exceptions.RequestException as e:
                 st.error(f"Could not reach backend: {e}")
             else:
                 if not r.ok:
                     st.error(r.text)
                 else:
-                    result = r.json()
+                    # Parse the body bytes directly; skips building r.text.
+                    result = orjson.loads(r.content)
                     st.session_state.last_result = result
                     st.session_state.session_id = result.get("session_id", "")
                     st.session_state.last_mode_label = mode_label
@@ -496,7 +437,7 @@ with right:
         st.stop()
 
     score = result.get("score")
-    review = result.get("review", [])
+    review = _review_lines(result.get("review"))
     meta = result.get("meta") or {
         "heuristics": {},
         "agents": result.get("agents", {}),
@@ -525,28 +466,33 @@ with right:
 
     with col2:
         heur = meta.get("heuristics", {})
-        st.markdown('<div class="card-soft">', unsafe_allow_html=True)
+        metric_rows = "".join(
+            f"<div>• {label}: <b>{heur.get(key, '?')}/10</b></div>"
+            for key, label in METRIC_LABELS
+        )
+        gemini_pill = (
+            "<div style='margin-top:0.45rem;'><span class='pill'><span class='pill-dot'></span>Gemini pipeline used</span></div>"
+            if meta.get("gemini_used")
+            else ""
+        )
+        # One element for the whole card, so the card-soft wrapper actually
+        # contains its rows.
         st.markdown(
-            '<div style="font-weight:600;margin-bottom:0.4rem;font-size:0.82rem;">Quick metrics</div>',
+            '<div class="card-soft">'
+            '<div style="font-weight:600;margin-bottom:0.4rem;font-size:0.82rem;">Quick metrics</div>'
+            f"{metric_rows}{gemini_pill}</div>",
             unsafe_allow_html=True,
         )
-        st.markdown(f"• Brightness: **{heur.get('brightness', '?')}/10**")
-        st.markdown(f"• Contrast: **{heur.get('contrast', '?')}/10**")
-        st.markdown(f"• Aspect fit: **{heur.get('aspect_ratio_fit', '?')}/10**")
-        if meta.get("gemini_used"):
-            st.markdown(
-                "<div style='margin-top:0.45rem;'><span class='pill'><span class='pill-dot'></span>Gemini pipeline used</span></div>",
-                unsafe_allow_html=True,
-            )
-        st.markdown("</div>", unsafe_allow_html=True)
 
     st.markdown('<div class="review-heading">Review</div>', unsafe_allow_html=True)
     if review:
-        for i, line in enumerate(review, start=1):
-            st.markdown(
-                f"<div class='review-item'><span class='index'>{i}.</span>{line}</div>",
-                unsafe_allow_html=True,
-            )
+        st.markdown(
+            "".join(
+                f"<div class='review-item'><span class='index'>{i}.</span>{line}</div>"
+                for i, line in enumerate(review, start=1)
+            ),
+            unsafe_allow_html=True,
+        )
     else:
         st.caption("No consolidated review text returned from the agents.")
 
@@ -561,9 +507,7 @@ with right:
         st.write("**Summary:**", v.get("summary", ""))
         details = v.get("details") or []
         if details:
-            st.write("**Visual notes:**")
-            for d in details:
-                st.write("- " + str(d))
+            st.markdown(_bullet_block("**Visual notes:**", details))
 
     # Heuristic Agent
     with st.expander("Heuristic Agent"):
@@ -573,13 +517,11 @@ with right:
         if metrics:
             st.write("**Raw metrics:**")
             st.write(
-                f"- Brightness: {metrics.get('brightness')}, "
-                f"Contrast: {metrics.get('contrast')}, "
-                f"Aspect fit: {metrics.get('aspect_ratio_fit')}"
+                "- " + ", ".join(f"{label}: {metrics.get(key)}" for key, label in METRIC_LABELS)
             )
         details = h.get("details") or []
-        for d in details:
-            st.write("- " + str(d))
+        if details:
+            st.markdown(_bullet_block("", details))
 
     # Coach Agent
     with st.expander("Coach Agent", expanded=True):
@@ -598,9 +540,7 @@ with right:
             quality = 0.0
 
         if strengths:
-            st.write("**What’s already working:**")
-            for s in strengths[:4]:
-                st.write("- " + str(s))
+            st.markdown(_bullet_block("**What’s already working:**", strengths[:4]))
 
         if quality >= 8.3:
             st.info(
@@ -609,19 +549,15 @@ with right:
             )
             show_micro = st.button("Show micro-tweaks", key="show_micro_tweaks")
             if show_micro and micro:
-                st.write("**Micro-tweaks to test:**")
-                for m in micro[:6]:
-                    st.write("- " + str(m))
+                st.markdown(_bullet_block("**Micro-tweaks to test:**", micro[:6]))
         else:
             if fixes:
-                st.write("**Fix these first:**")
-                for f in fixes[:5]:
-                    st.write("- " + str(f))
+                st.markdown(_bullet_block("**Fix these first:**", fixes[:5]))
 
             if redesign:
-                st.write("**Redesign directions to experiment with:**")
-                for r_idea in redesign[:4]:
-                    st.write("- " + str(r_idea))
+                st.markdown(
+                    _bullet_block("**Redesign directions to experiment with:**", redesign[:4])
+                )
 
 
     st.markdown(